@@ -0,0 +1,131 @@
+"""measures the time until all connections are established, using the fake jack backend.
+
+usage: python benchmarks/bench_convergence.py [--scale 1 10] [--latency 0.0001]
+"""
+
+import argparse
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from time import monotonic, perf_counter, sleep
+
+import yaml
+
+from jack_connection_manager.ConnectionManager import ConnectionManager
+from jack_connection_manager.config import load_rules
+from jack_connection_manager.edges import EdgeState
+from jack_connection_manager.fake_jack import FakeJack, FakeServer
+from jack_connection_manager.rules import Rule, expand
+
+wintermute = (
+    Path(__file__).parent.parent / "connection_files" / "wintermute_connections.yml"
+)
+
+
+def scaled_rules(rules: list[Rule], scale: int) -> list[Rule]:
+    """copies of the rules with renamed clients, e.g. system:capture_ -> system_2:capture_"""
+
+    def rename(prefix: str, k: int) -> str:
+        client, port = prefix.split(":", 1)
+        return f"{client}_{k}:{port}" if k else prefix
+
+    return [
+        rule._replace(
+            source_prefix=rename(rule.source_prefix, k),
+            sink_prefix=rename(rule.sink_prefix, k),
+        )
+        for k in range(scale)
+        for rule in rules
+    ]
+
+
+def write_config(path: Path, rules: list[Rule]):
+    conf = [
+        {
+            "client": rule.source_prefix,
+            "n_channels": rule.count,
+            "start_index": rule.source_start,
+            "connections": [
+                {
+                    "client": rule.sink_prefix,
+                    "start_index": rule.sink_start,
+                    **({"priority": rule.priority} if rule.priority else {}),
+                }
+            ],
+        }
+        for rule in rules
+    ]
+    path.write_text(yaml.dump(conf))
+
+
+def add_ports(server: FakeServer, rules: list[Rule]):
+    """registers all ports used by the rules, sources as outputs and sinks as inputs"""
+    for rule in rules:
+        for i in range(rule.count):
+            for name, is_output in (
+                (f"{rule.source_prefix}{rule.source_start + i}", True),
+                (f"{rule.sink_prefix}{rule.sink_start + i}", False),
+            ):
+                if name not in server.ports:
+                    server.add_port(name, is_output)
+
+
+def wait_converged(cm: ConnectionManager, n_edges: int, timeout: float = 600):
+    deadline = monotonic() + timeout
+    while cm.edges.counts[EdgeState.CONNECTED] < n_edges:
+        if monotonic() > deadline:
+            raise TimeoutError("connections did not converge")
+        sleep(0.001)
+
+
+def run(config_path: Path, rules: list[Rule], latency: float, ports_first: bool):
+    """returns the time until convergence and the number of jack calls.
+    with ports_first, all ports exist before the connection manager starts,
+    otherwise they are registered while it is running."""
+    backend = FakeJack(latency)
+    server = backend.server()
+    if ports_first:
+        add_ports(server, rules)
+        server.flush()
+
+    t_start = perf_counter()
+    cm = ConnectionManager(config_path, backend=backend, watch_config=False)
+    loop = threading.Thread(target=cm.connection_loop)
+    loop.start()
+    if not ports_first:
+        add_ports(server, rules)
+    wait_converged(cm, len(set(expand(rules))))
+    duration = perf_counter() - t_start
+
+    cm.deactivate()
+    loop.join()
+    return duration, sum(server.calls.values()), len(server.connections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--latency", type=float, default=0.0001)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    rules = load_rules(wintermute, use_cache=False)
+    print(f"{'scale':>6}{'scenario':>14}{'edges':>8}{'time':>12}{'jack calls':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scale:
+            config_path = Path(tmp) / f"connections_{scale}.yml"
+            scaled = scaled_rules(rules, scale)
+            write_config(config_path, scaled)
+            for ports_first, scenario in ((True, "startup"), (False, "registration")):
+                duration, calls, edges = run(
+                    config_path, scaled, args.latency, ports_first
+                )
+                print(
+                    f"{scale:>6}{scenario:>14}{edges:>8}{duration*1000:>9.1f} ms"
+                    f"{calls:>12}"
+                )
+
+
+if __name__ == "__main__":
+    main()
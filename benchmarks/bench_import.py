@@ -0,0 +1,90 @@
+"""checks the import time of the command line interface against a budget.
+
+the cli is started by monitoring checks and systemd units, e.g. with -l or --help,
+which must not pay for the modules of the running connection manager. fails if
+importing the cli takes longer than the budget or imports one of those modules.
+
+usage: python benchmarks/bench_import.py [--budget 150] [--repeat 5]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+cli_module = "jack_connection_manager.jack_connection_manager"
+# only needed for running the connection manager, not for --help, --version or -l
+deferred_modules = [
+    "asyncio",
+    "jack",
+    "yaml",
+    "sdnotify",
+    "importlib.metadata",
+    "jack_connection_manager._version",
+    "jack_connection_manager.ConnectionManager",
+]
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    src = str(Path(__file__).parent.parent / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    return subprocess.run(
+        [sys.executable, *args], check=True, capture_output=True, text=True, env=env
+    )
+
+
+def import_times(module: str) -> dict[str, float]:
+    """returns the cumulative import time of every module in seconds, from -X importtime"""
+    times = {}
+    output = python("-X", "importtime", "-c", f"import {module}").stderr
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def imported_modules(module: str) -> set[str]:
+    output = python(
+        "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"
+    ).stdout
+    return set(output.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget", type=float, default=150, help="import time budget in ms"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_times(cli_module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times[cli_module])
+    total = best[cli_module]
+    click = best.get("click", 0)
+    print(f"{'cli import':>20}{total*1000:>11.1f} ms")
+    print(f"{'of which click':>20}{click*1000:>11.1f} ms")
+    for name, t in sorted(best.items(), key=lambda item: -item[1])[:10]:
+        if name.startswith("jack_connection_manager") and name != cli_module:
+            print(f"{name:>50}{t*1000:>11.1f} ms")
+
+    failures = []
+    if total * 1000 > args.budget:
+        failures.append(
+            f"importing the cli took {total*1000:.1f} ms, budget is {args.budget:.0f} ms"
+        )
+    eager = sorted(imported_modules(cli_module) & set(deferred_modules))
+    if eager:
+        failures.append(f"the cli imports {', '.join(eager)} at load time")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
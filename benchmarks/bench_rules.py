@@ -0,0 +1,171 @@
+"""compares the range-compressed RuleIndex with the old per-channel dict-of-sets
+representation of a connection file, and the index of pattern rules
+with matching every port against all patterns.
+
+usage: python benchmarks/bench_rules.py [--ports 10000] [--patterns 10000]
+"""
+
+import argparse
+import tracemalloc
+from time import perf_counter
+
+from jack_connection_manager.rules import RuleIndex, compile_pattern_rule, parse_config
+
+
+def synthetic_config(n_ports: int, n_channels: int = 64, n_sinks: int = 2):
+    """sources with n_channels channels, each connected to n_sinks sink clients,
+    with a total of roughly n_ports ports"""
+    n_sources = max(1, n_ports // (n_channels * (1 + n_sinks)))
+    return [
+        {
+            "client": f"source{i}:out_",
+            "n_channels": n_channels,
+            "connections": [
+                {"client": f"sink{i}_{j}:in_", "start_index": 0} for j in range(n_sinks)
+            ],
+        }
+        for i in range(n_sources)
+    ]
+
+
+# source and sink pattern of the i-th rule, {{ch}} is the placeholder
+pattern_layouts = {
+    # every renderer has its own block of inputs of a wave field synthesis system
+    "distinct": ("render{i}:out_{{ch}}", "wfs:in_{i}_{{ch}}"),
+    # all sink patterns start with the same text, they differ in their end
+    "shared prefix": ("render{i}:out_{{ch}}", "wfs:ch{{ch}}_render{i}"),
+    # the client name of the patterns is a placeholder
+    "leading placeholder": ("{{host}}:render{i}_{{ch}}", "{{host}}:wfs_in_{i}_{{ch}}"),
+}
+
+
+def synthetic_patterns(n_rules: int, layout: str = "distinct"):
+    """pattern rules of n_rules different source clients"""
+    source, sink = pattern_layouts[layout]
+    return [
+        {
+            "pattern": source.format(i=i),
+            "connections": [{"pattern": sink.format(i=i)}],
+        }
+        for i in range(n_rules)
+    ]
+
+
+def linear_peers(patterns, name: str) -> set[str]:
+    """matches the port against every pattern, without the index"""
+    peers = set()
+    for source, sink in patterns:
+        for pattern, peer in ((source, sink), (sink, source)):
+            values = pattern.match(name)
+            if values is not None:
+                peer_name = peer.format(values)
+                if peer_name is not None:
+                    peers.add(peer_name)
+    return peers
+
+
+def bench_patterns(n_rules: int, layout: str = "distinct", n_channels: int = 8):
+    rules = parse_config(synthetic_patterns(n_rules, layout))
+    index = RuleIndex(rules)
+    patterns = [compile_pattern_rule(rule) for rule in rules]
+    # a registration burst of 100 source clients and their sinks
+    names = [
+        pattern.format(i=i).format(host="studio", ch=ch)
+        for i in range(0, n_rules, max(1, n_rules // 100))
+        for ch in range(1, n_channels + 1)
+        for pattern in pattern_layouts[layout]
+    ]
+    t_start = perf_counter()
+    for name in names:
+        index.peers(name)
+    index_lookup = perf_counter() - t_start
+    t_start = perf_counter()
+    for name in names:
+        linear_peers(patterns, name)
+    linear_lookup = perf_counter() - t_start
+    return index_lookup / len(names), linear_lookup / len(names)
+
+
+def add_to_dict_of_sets(d: dict, key, value):
+    if key in d:
+        d[key].add(value)
+    else:
+        d[key] = set((value,))
+
+
+def build_dicts(conf):
+    """the representation used before the RuleIndex"""
+    source_ports: dict[str, set[str]] = {}
+    all_ports: dict[str, set[str]] = {}
+    for source_client in conf:
+        source_start_index = source_client.get("start_index", 1)
+        for sink_client in source_client["connections"]:
+            sink_start_index = sink_client.get("start_index", 1)
+            for i in range(source_client["n_channels"]):
+                source_port = f"{source_client['client']}{source_start_index+i}"
+                sink_port = f"{sink_client['client']}{sink_start_index+i}"
+                add_to_dict_of_sets(source_ports, source_port, sink_port)
+                add_to_dict_of_sets(all_ports, sink_port, source_port)
+                add_to_dict_of_sets(all_ports, source_port, sink_port)
+    return source_ports, all_ports
+
+
+def measure(build, conf):
+    tracemalloc.start()
+    t_start = perf_counter()
+    result = build(conf)
+    duration = perf_counter() - t_start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, duration, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=10000)
+    parser.add_argument(
+        "--patterns", type=int, default=10000, help="largest number of pattern rules"
+    )
+    args = parser.parse_args()
+
+    conf = synthetic_config(args.ports)
+    (_, all_ports), dict_time, dict_memory = measure(build_dicts, conf)
+    index, index_time, index_memory = measure(
+        lambda c: RuleIndex(parse_config(c)), conf
+    )
+
+    t_start = perf_counter()
+    for name in all_ports:
+        all_ports[name]
+    dict_lookup = perf_counter() - t_start
+    t_start = perf_counter()
+    for name in all_ports:
+        index.peers(name)
+    index_lookup = perf_counter() - t_start
+
+    print(f"{len(all_ports)} ports, {len(index.rules)} rules")
+    print(f"{'':12}{'build':>12}{'memory':>12}{'lookup/port':>14}")
+    for label, build_time, memory, lookup in (
+        ("dict", dict_time, dict_memory, dict_lookup),
+        ("rule index", index_time, index_memory, index_lookup),
+    ):
+        print(
+            f"{label:12}{build_time*1000:>9.2f} ms{memory/1024:>9.0f} kB"
+            f"{lookup/len(all_ports)*1e6:>11.2f} us"
+        )
+
+    print()
+    print(f"{'layout':20}{'pattern rules':>14}{'indexed/port':>16}{'linear/port':>16}")
+    for layout in pattern_layouts:
+        n_rules = 100
+        while n_rules <= args.patterns:
+            index_lookup, linear_lookup = bench_patterns(n_rules, layout)
+            print(
+                f"{layout:20}{n_rules:>14}"
+                f"{index_lookup*1e6:>13.2f} us{linear_lookup*1e6:>13.2f} us"
+            )
+            n_rules *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""compares loading the rules of large connection files from yaml and from the config cache.
+
+usage: python benchmarks/bench_startup.py [--rules 100 1000 10000]
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import yaml
+
+from jack_connection_manager import config
+from jack_connection_manager.rules import parse_config
+
+
+def write_config(path: Path, n_rules: int, n_sinks: int = 4):
+    conf = [
+        {
+            "client": f"source{i}:out_",
+            "n_channels": 64,
+            "start_index": 0,
+            "connections": [
+                {"client": f"sink{i}_{j}:in_", "start_index": 1} for j in range(n_sinks)
+            ],
+        }
+        for i in range(max(1, n_rules // n_sinks))
+    ]
+    path.write_text(yaml.dump(conf))
+
+
+def timed(f, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t_start = perf_counter()
+        f()
+        best = min(best, perf_counter() - t_start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'rules':>8}{'pure yaml':>14}{'libyaml':>14}{'cached':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rules in args.rules:
+            path = Path(tmp) / f"connections_{n_rules}.yml"
+            write_config(path, n_rules)
+
+            # the loader used before the cache was added
+            pure = timed(
+                lambda: parse_config(yaml.load(path.read_bytes(), yaml.Loader))
+            )
+            cold = timed(lambda: config.load_rules(path, use_cache=False))
+            config.load_rules(path)
+            cached = timed(lambda: config.load_rules(path))
+            print(
+                f"{n_rules:>8}{pure*1000:>11.1f} ms{cold*1000:>11.1f} ms"
+                f"{cached*1000:>11.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
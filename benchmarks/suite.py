@@ -0,0 +1,409 @@
+"""benchmark suite for parsing, initial sync, the connection loop, removing connections,
+reporting missing connections and switching profiles, on synthetic configs from 100 to 50k edges.
+
+every case runs several times in its own process and reports the best wall time,
+peak RSS and the number of jack calls on the fake backend. results are compared with
+baseline.json and the suite fails if a case got slower, bigger or chattier than the
+threshold allows.
+
+usage:
+    python benchmarks/suite.py                      # compare with the baseline
+    python benchmarks/suite.py --update-baseline    # store new baseline values
+    python benchmarks/suite.py --edges 100 1000 --cases parse initial_sync
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from time import perf_counter, sleep
+
+import yaml
+
+from bench_convergence import add_ports, wait_converged, write_config
+
+from jack_connection_manager.ConnectionManager import ConnectionManager
+from jack_connection_manager.check import run_check
+from jack_connection_manager.config import load_rules
+from jack_connection_manager.edges import EdgeTable
+from jack_connection_manager.fake_jack import FakeJack
+from jack_connection_manager.remove import remove_connections
+from jack_connection_manager.rules import Rule, RuleIndex, expand
+
+baseline_path = Path(__file__).parent / "baseline.json"
+edge_counts = [100, 1000, 10000, 50000]
+# wall time is noisy, so times are only reported as regressions if they also grew
+# by this many seconds, or doubled for cases that take less than that
+min_time_difference = 0.005
+
+
+def synthetic_rules(n_edges: int, n_channels: int = 50, n_sinks: int = 2) -> list[Rule]:
+    """sources with n_channels channels, each connected to n_sinks sink clients"""
+    n_channels = min(n_channels, max(1, n_edges // n_sinks))
+    n_sources = max(1, n_edges // (n_channels * n_sinks))
+    return [
+        Rule(f"source{i}:out_", 1, n_channels, f"sink{i}_{j}:in_", 1)
+        for i in range(n_sources)
+        for j in range(n_sinks)
+    ]
+
+
+def manager(
+    config_path: Path, rules: list[Rule], connected: bool = False, strict: bool = False
+):
+    """returns a connection manager on a fake server with all ports of the rules,
+    with all connections already made if connected is set"""
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules)
+    if connected:
+        for source, sink in set(expand(rules)):
+            server.connect(source, sink)
+    server.flush()
+    cm = ConnectionManager(
+        config_path, backend=backend, watch_config=False, strict=strict
+    )
+    server.flush()
+    return cm, server
+
+
+def reset(cm: ConnectionManager, server):
+    """forgets everything the connection manager queued so far"""
+    cm.queue.clear()
+    cm.edges = EdgeTable()
+    server.calls.clear()
+
+
+def start_timer() -> float:
+    """perf_counter() for measurements of a few microseconds, after the setup"""
+    # a full collection of the objects created for the setup would otherwise
+    # land in the measurement, depending on how close it was to being due
+    gc.collect()
+    return perf_counter()
+
+
+def case_parse(config_path: Path, rules: list[Rule]):
+    cm = ConnectionManager.__new__(ConnectionManager)
+    cm.shared_rules = None
+    cm.profile = None
+    t_start = perf_counter()
+    cm.build_connection_dict(config_path, use_cache=False)
+    return perf_counter() - t_start, 0
+
+
+def case_initial_sync(config_path: Path, rules: list[Rule]):
+    cm, server = manager(config_path, rules)
+    reset(cm, server)
+    t_start = perf_counter()
+    cm.set_initial_connections()
+    duration = perf_counter() - t_start
+    cm.deactivate()
+    return duration, sum(server.calls.values())
+
+
+def case_connection_loop(config_path: Path, rules: list[Rule]):
+    cm, server = manager(config_path, rules)
+    server.calls.clear()
+    t_start = perf_counter()
+    loop = threading.Thread(target=cm.connection_loop)
+    loop.start()
+    wait_converged(cm, len(set(expand(rules))))
+    duration = perf_counter() - t_start
+    cm.deactivate()
+    loop.join()
+    return duration, sum(server.calls.values())
+
+
+def case_connection_loop_traced(config_path: Path, rules: list[Rule]):
+    """the connection loop with tracing, compare with connection_loop"""
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules)
+    server.flush()
+    cm = ConnectionManager(
+        config_path,
+        backend=backend,
+        watch_config=False,
+        trace_path=config_path.parent / "trace.json",
+    )
+    server.flush()
+    server.calls.clear()
+    t_start = perf_counter()
+    loop = threading.Thread(target=cm.connection_loop)
+    loop.start()
+    wait_converged(cm, len(set(expand(rules))))
+    duration = perf_counter() - t_start
+    cm.deactivate()
+    loop.join()
+    return duration, sum(server.calls.values())
+
+
+def case_remove_connections(config_path: Path, rules: list[Rule]):
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules)
+    for source, sink in set(expand(rules)):
+        server.connect(source, sink)
+    server.calls.clear()
+    t_start = perf_counter()
+    remove_connections((), backend)
+    return perf_counter() - t_start, sum(server.calls.values())
+
+
+def case_enforce(config_path: Path, rules: list[Rule]):
+    """removes the connections that are not in the config from a graph
+    where 10% of the connections are unwanted, the rest stays untouched"""
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules)
+    wanted = sorted(set(expand(rules)))
+    for source, sink in wanted:
+        server.connect(source, sink)
+    # connect every 10th source to the sink of the next channel instead
+    for source, sink in wanted[::10]:
+        prefix, channel = sink.rsplit("_", 1)
+        unwanted = f"{prefix}_{int(channel) % 50 + 1}"
+        if (source, unwanted) not in server.connections:
+            server.connect(source, unwanted)
+    server.calls.clear()
+    t_start = perf_counter()
+    remove_connections((), backend, rules=RuleIndex(rules))
+    return perf_counter() - t_start, sum(server.calls.values())
+
+
+def case_print_missing(config_path: Path, rules: list[Rule]):
+    cm, server = manager(config_path, rules, connected=True)
+    # half of the connections are missing
+    for source, sink in list(server.connections)[::2]:
+        server.disconnect(source, sink)
+    # the graph mirror is updated on the loop, which isn't running here
+    server.flush()
+    cm.run_handed_over()
+    server.calls.clear()
+    t_start = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cm.print_missing_connections()
+    duration = perf_counter() - t_start
+    cm.deactivate()
+    return duration, sum(server.calls.values())
+
+
+def case_check(config_path: Path, rules: list[Rule]):
+    """the read-only check of -l with json output and a warm config cache"""
+    load_rules(config_path)
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules)
+    for source, sink in list(set(expand(rules)))[::2]:
+        server.connect(source, sink)
+    server.calls.clear()
+    t_start = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_check(config_path, "check", "json", backend=backend)
+    return perf_counter() - t_start, sum(server.calls.values())
+
+
+def case_registration_callback(config_path: Path, rules: list[Rule]):
+    """time spent in the port registration callback per port,
+    which has to stay constant as the fan-out grows"""
+    cm, server = manager(config_path, rules)
+    ports = list(server.ports.values())
+    server.calls.clear()
+    t_start = start_timer()
+    for port in ports:
+        cm.port_registration_callback(port, True)
+    duration = (perf_counter() - t_start) / len(ports)
+    cm.deactivate()
+    return duration, sum(server.calls.values())
+
+
+def case_strict_event(config_path: Path, rules: list[Rule]):
+    """time the strict mode needs to check a connect event of a wanted connection,
+    which must not read the graph"""
+    cm, server = manager(config_path, rules, connected=True, strict=True)
+    edges = list(server.connections)
+    server.calls.clear()
+    t_start = start_timer()
+    for out_port, in_port in edges:
+        cm.enforce_edge(out_port, in_port, True)
+    duration = (perf_counter() - t_start) / len(edges)
+    cm.deactivate()
+    return duration, sum(server.calls.values())
+
+
+def case_profile_switch(config_path: Path, rules: list[Rule]):
+    """switch between two profiles that differ in the sinks of every 10th rule,
+    the connections of the other rules stay untouched"""
+    changed = [
+        rule._replace(sink_prefix=f"alt_{rule.sink_prefix}") if i % 10 == 0 else rule
+        for i, rule in enumerate(rules)
+    ]
+    write_config(config_path, rules)
+    rule_list = yaml.safe_load(config_path.read_text())
+    write_config(config_path, changed)
+    changed_list = yaml.safe_load(config_path.read_text())
+    config_path.write_text(yaml.dump({"profiles": {"a": rule_list, "b": changed_list}}))
+
+    backend = FakeJack()
+    server = backend.server()
+    add_ports(server, rules + changed)
+    for source, sink in set(expand(rules)):
+        server.connect(source, sink)
+    server.flush()
+    cm = ConnectionManager(config_path, backend=backend, watch_config=False)
+    server.flush()
+    server.calls.clear()
+    t_start = perf_counter()
+    cm.switch_profile("b")
+    duration = perf_counter() - t_start
+    cm.deactivate()
+    return duration, sum(server.calls.values())
+
+
+def case_priority_converge(config_path: Path, rules: list[Rule]):
+    """time until the connections of every 10th rule from the end are made, which
+    have a higher priority than the others, compare with connection_loop for all"""
+    rules = [
+        rule._replace(priority=10) if i % 10 == 0 else rule
+        for i, rule in enumerate(reversed(rules))
+    ]
+    write_config(config_path, rules)
+    cm, server = manager(config_path, rules)
+    server.calls.clear()
+    t_start = perf_counter()
+    loop = threading.Thread(target=cm.connection_loop)
+    loop.start()
+    while 10 not in cm.queue.converge_times:
+        sleep(0.0005)
+    duration = perf_counter() - t_start
+    wait_converged(cm, len(set(expand(rules))))
+    cm.deactivate()
+    loop.join()
+    return duration, sum(server.calls.values())
+
+
+cases = {
+    "parse": case_parse,
+    "initial_sync": case_initial_sync,
+    "connection_loop": case_connection_loop,
+    "connection_loop_traced": case_connection_loop_traced,
+    "remove_connections": case_remove_connections,
+    "enforce": case_enforce,
+    "print_missing": case_print_missing,
+    "check": case_check,
+    "registration_callback": case_registration_callback,
+    "strict_event": case_strict_event,
+    "profile_switch": case_profile_switch,
+    "priority_converge": case_priority_converge,
+}
+
+
+def run_case(case: str, n_edges: int) -> dict:
+    logging.basicConfig(level=logging.ERROR)
+    rules = synthetic_rules(n_edges)
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "connections.yml"
+        write_config(config_path, rules)
+        duration, calls = cases[case](config_path, rules)
+    # ru_maxrss is in kB on linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {"time": duration, "rss": rss, "calls": calls}
+
+
+def run_in_subprocess(case: str, n_edges: int) -> dict:
+    env = dict(os.environ)
+    src = str(Path(__file__).parent.parent / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    output = subprocess.run(
+        [sys.executable, __file__, "--run-case", case, str(n_edges)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+    return json.loads(output)
+
+
+def format_time(seconds: float) -> str:
+    if seconds < 0.001:
+        return f"{seconds*1e6:.2f} us"
+    return f"{seconds*1000:.2f} ms"
+
+
+def regressions(result: dict, baseline: dict, threshold: float) -> list[str]:
+    found = []
+    for metric in ("time", "rss", "calls"):
+        if metric not in baseline:
+            continue
+        limit = baseline[metric] * (1 + threshold)
+        if metric == "time":
+            margin = min(min_time_difference, baseline[metric])
+            limit = max(limit, baseline[metric] + margin)
+        if result[metric] > limit:
+            found.append(f"{metric} {baseline[metric]:.4g} -> {result[metric]:.4g}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--edges", type=int, nargs="+", default=edge_counts)
+    parser.add_argument("--cases", nargs="+", choices=cases, default=list(cases))
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="allowed relative increase over the baseline (default: 0.5)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs of each case, the best one is reported (default: 3)",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--run-case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        case, n_edges = args.run_case
+        print(json.dumps(run_case(case, int(n_edges))))
+        return
+
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    failed = False
+    print(f"{'case':>22}{'edges':>8}{'time':>12}{'peak rss':>12}{'jack calls':>12}")
+    for case in args.cases:
+        for n_edges in args.edges:
+            key = f"{case}/{n_edges}"
+            runs = [run_in_subprocess(case, n_edges) for _ in range(args.repeat)]
+            result = {metric: min(r[metric] for r in runs) for metric in runs[0]}
+            found = regressions(result, baseline.get(key, {}), args.threshold)
+            failed |= bool(found)
+            if args.update_baseline:
+                baseline[key] = result
+            print(
+                f"{case:>22}{n_edges:>8}{format_time(result['time']):>12}"
+                f"{result['rss']/2**20:>9.1f} MB{result['calls']:>12}"
+                + (f"  REGRESSION: {', '.join(found)}" if found else "")
+            )
+
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+    elif failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,180 +1,1079 @@
-import yaml
-import jack
-
 from pathlib import Path
-from time import sleep
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING
 
+import asyncio
 import logging
 import sys
-import queue
-from threading import Event, Timer
+from collections import deque
+from collections.abc import Callable
+from threading import Event
+
+from jack_connection_manager.check import check, format_text
+from jack_connection_manager.config import (
+    Config,
+    ProfileError,
+    SharedRules,
+    load_config,
+)
+from jack_connection_manager.edges import EdgeState, EdgeTable
+from jack_connection_manager.graph import GraphMirror, GraphSnapshot
+from jack_connection_manager.metrics import Metrics, samples
+from jack_connection_manager.remove import removal_plan
+from jack_connection_manager.retry import RetryScheduler
+from jack_connection_manager.rules import RuleIndex
+from jack_connection_manager.scheduler import ConnectionQueue
+from jack_connection_manager.tracing import EdgeTracer
+from jack_connection_manager.watch import ConfigWatcher
+
+if TYPE_CHECKING:
+    import jack
 
 log = logging.getLogger()
 
+# waiting time between attempts to connect to the jack server,
+# growing by reconnect_backoff up to reconnect_max_wait_time seconds
 reconnect_wait_time = 2
+reconnect_backoff = 1.5
+reconnect_max_wait_time = 10
+# number of attempts when starting, reconnecting after a server shutdown never gives up
 reconnect_number_retries = 20
 
+# retries of failed connections are delayed by
+# retry_timer * retry_backoff**n seconds, at most retry_max_delay seconds
 retry_timer = 1
+retry_backoff = 1.5
+retry_max_delay = 10
+retry_jitter = 0.1
 n_retries = 15
 
+# port registrations are collected until no new one arrived for
+# coalesce_window seconds, but at most for coalesce_max_latency seconds
+coalesce_window = 0.01
+coalesce_max_latency = 0.1
 
-def add_to_dict_of_sets(d: dict, key, value):
-    if key in d:
-        d[key].add(value)
-    else:
-        d[key] = set((value,))
+# number of queued connections made before other events on the loop get a turn
+connect_batch_size = 64
 
+# seconds between the comparisons of the graph mirror with a fresh snapshot of the graph
+graph_check_interval = 60
 
-class ConnectionManager:
-    def __init__(self, config_path: Path, clientname="jack_connection_manager") -> None:
-        # TODO handle jack server not existing
+# after the disconnects of a profile switch, its connections are made right away
+# for up to this many seconds, the remaining ones are queued
+profile_switch_time = 0.05
 
-        self.source_ports: dict[str, set[str]] = {}
-        self.all_ports: dict[str, set[str]] = {}
 
-        self.build_connection_dict(config_path)
+class ConnectionManager:
+    def __init__(
+        self,
+        config_path: Path,
+        clientname="jack_connection_manager",
+        servername: str | None = None,
+        coalesce_window: float = coalesce_window,
+        coalesce_max_latency: float = coalesce_max_latency,
+        use_config_cache: bool = True,
+        watch_config: bool = True,
+        prune_on_reload: bool = False,
+        strict: bool = False,
+        exclude: tuple[str, ...] = (),
+        profile: str | None = None,
+        shared_rules: SharedRules | None = None,
+        trace_path: Path | None = None,
+        backend=None,
+    ) -> None:
+        """with strict, connections that are not in the connection file are removed
+        and removed ones that are in it are restored, except for ports starting
+        with one of the exclude prefixes.
+        profile selects a profile of the connection file instead of its default profile.
+        managers of different servers can share their compiled rules with shared_rules.
+        with trace_path, the lifecycle of every connection is written there as a chrome trace.
+        backend replaces the jack module, e.g. with a fake_jack.FakeJack"""
+        if backend is None:
+            import jack as backend
+        self.jack = backend
+        # everything except the jack callbacks runs on this loop, see connection_loop
+        self.loop = asyncio.new_event_loop()
 
-        self.connect_to_jack_server(clientname)
-        self.queue: queue.Queue[tuple[jack.Port, jack.Port, int]] = queue.Queue()
+        self.config_path = config_path
+        self.clientname = clientname
+        self.servername = servername
+        self.use_config_cache = use_config_cache
+        self.prune_on_reload = prune_on_reload
+        self.strict = strict
+        self.exclude = tuple(exclude)
+        self.shared_rules = shared_rules
+        self.profile = profile
+        # compiled rules of every profile, the file without profiles is stored as None
+        self.profile_indexes: dict[str | None, RuleIndex] = {}
+        # operations and duration in seconds of the last profile switch
+        self.profile_stats: dict[str, float] = {
+            "switches": 0,
+            "disconnected": 0,
+            "connected": 0,
+            "queued": 0,
+            "duration": 0.0,
+        }
+        # number of connections removed and restored by the strict mode
+        self.strict_stats = {"removed": 0, "restored": 0}
+        self.rules: RuleIndex
+        self.edges = EdgeTable()
+        # mirror of the jack graph, seeded by the initial sync and updated from the callbacks
+        self.graph: GraphMirror
+        # connects skipped because the mirror had the connection already, and ports and
+        # connections the mirror missed that were corrected by the consistency check
+        self.graph_stats = {"skipped_connects": 0, "corrected": 0}
+        self.graph_check_timer: asyncio.TimerHandle | None = None
+        # (output, input) connections that were made by the connection manager
+        self.created_edges: set[tuple[str, str]] = set()
+        # duration of the phases of the last initial sync in seconds
+        self.sync_timings: dict[str, float] = {}
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_latency = coalesce_max_latency
+        # number of registration events and of reconcile passes run for them,
+        # without coalescing there would be one pass per event
+        self.reconcile_stats = {"events": 0, "passes": 0}
+        # number of server restarts and the time in seconds from the last
+        # shutdown until all connections were established again
+        self.reconnect_stats: dict[str, float | None] = {
+            "reconnects": 0,
+            "reconverge_time": None,
+        }
+        # time the jack server was lost, set until the graph converged again
+        self.server_lost_at: float | None = None
+        self.server_lost = Event()
+        self.reconnect_task: asyncio.Task | None = None
+        # task connecting the queued edges, runs as long as the loop
+        self.worker: asyncio.Task | None = None
+        self.metrics = Metrics()
+        self.started_at = monotonic()
+        # time all connections were established, None until the first convergence
+        self.converged_at: float | None = None
+        # stops the attempts to connect to the jack server
         self.stop_event = Event()
-        self.c.set_port_registration_callback(self.set_connection_for_port, False)
-        self.c.activate()
+        self.stop_requested = asyncio.Event()
+        # objects with a stop() method that are stopped on the loop when shutting down,
+        # e.g. a metrics.MetricsExporter
+        self.services: list = []
+        # called on the loop when the progress changed, e.g. by a convergence,
+        # queued connections or a lost server, see systemd.ServiceNotifier
+        self.progress_listeners: list[Callable[[], None]] = []
+        self.tracer: EdgeTracer | None = None
+        if trace_path is not None:
+            self.tracer = EdgeTracer(self.loop, trace_path, servername)
+            self.services.append(self.tracer)
+
+        self.build_connection_dict(config_path, use_config_cache)
+
+        self.connect_to_jack_server(clientname, servername)
+        # (output, input) port names that should be connected, highest priority first
+        self.queue = ConnectionQueue(self.edge_priority, self.tracer)
+        # (callback, *args) tuples from the jack callbacks and hand_over, waiting
+        # for the loop. a single queue keeps them in the order jack sent them,
+        # e.g. the disconnects of a closing client before its unregistrations
+        self.incoming: deque[tuple] = deque()
+        self.incoming_scheduled = False
+        # (port name, registered) tuples waiting for the next reconcile pass
+        self.port_events: list[tuple[str, bool]] = []
+        # wanted (output, input) connections removed by others, restored by the
+        # next reconcile pass in strict mode if both ports still exist then
+        self.removed_edges: list[tuple[str, str]] = []
+        self.reconcile_timer: asyncio.TimerHandle | None = None
+        # loop time of the next reconcile pass, moved back by each new event
+        # until the coalesce deadline of the first event of the pass
+        self.reconcile_due = 0.0
+        self.reconcile_deadline = 0.0
+        self.retries = RetryScheduler(
+            self.loop,
+            self.queue.retry,
+            base_delay=retry_timer,
+            backoff=retry_backoff,
+            max_delay=retry_max_delay,
+            jitter=retry_jitter,
+            budget=n_retries,
+        )
+        self.activate_client()
         self.set_initial_connections()
+        self.watcher = ConfigWatcher(
+            config_path, self.reload, self.loop, use_inotify=watch_config
+        )
 
-    def connect_to_jack_server(self, clientname, servername=None):
+    def connect_to_jack_server(
+        self,
+        clientname,
+        servername=None,
+        n_retries: int | None = reconnect_number_retries,
+    ):
+        """opens the jack client, exits after n_retries failed attempts.
+        with n_retries None, it keeps trying until the connection manager is stopped.
+        returns False if it was stopped before connecting."""
         n_tries = 0
-        while n_tries < reconnect_number_retries:
+        wait_time = reconnect_wait_time
+        while n_retries is None or n_tries < n_retries:
             try:
-                self.c = jack.Client(
+                self.c = self.jack.Client(
                     clientname, no_start_server=True, servername=servername
                 )
-                break
-            except jack.JackOpenError:
+                return True
+            except self.jack.JackOpenError:
                 logging.warning("couldn't connect to jack server. retrying...")
                 n_tries += 1
-                sleep(reconnect_wait_time)
-        else:
-            logging.error("could not connect to jack server")
-            sys.exit(-2)
-
-    def build_connection_dict(self, config_path: Path):
-        with open(config_path) as f:
-            conf = yaml.load(f, yaml.Loader)
-
-        for source_client in conf:
-            source_base = source_client["client"]
-            n_channels = source_client["n_channels"]
-            source_start_index = (
-                source_client["start_index"] if "start_index" in source_client else 1
-            )
+                if self.stop_event.wait(wait_time):
+                    return False
+                wait_time = min(wait_time * reconnect_backoff, reconnect_max_wait_time)
+
+        logging.error("could not connect to jack server")
+        sys.exit(-2)
+
+    def activate_client(self):
+        self.c.set_shutdown_callback(self.shutdown_callback)
+        self.c.set_port_registration_callback(self.port_registration_callback, False)
+        self.c.set_port_connect_callback(self.port_connect_callback, False)
+        self.c.set_port_rename_callback(self.port_rename_callback, False)
+        self.c.set_client_registration_callback(
+            self.client_registration_callback, False
+        )
+        self.c.activate()
+
+    def call_threadsafe(self, callback, *args):
+        """runs callback on the loop, used by the callbacks running on jack threads"""
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop was closed while the client was shutting down
+            pass
 
-            for sink_client in source_client["connections"]:
-                sink_base = sink_client["client"]
-                sink_start_index = (
-                    sink_client["start_index"] if "start_index" in sink_client else 1
+    def shutdown_callback(self, status, reason: str):
+        """runs on a jack thread when the server shuts down, the client can't be used anymore"""
+        self.server_lost_at = monotonic()
+        self.server_lost.set()
+        self.call_threadsafe(self.start_reconnect)
+
+    def start_reconnect(self):
+        self.progress_changed()
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = self.loop.create_task(self.reconnect())
+
+    async def reconnect(self):
+        """replaces the client after the server shut down and resyncs the whole graph"""
+        log.warning("jack server shut down, reconnecting...")
+        try:
+            self.c.close()
+        except self.jack.JackError:
+            pass
+
+        # everything queued refers to the old graph
+        self.retries.cancel_all()
+        self.queue.clear()
+        if self.tracer is not None:
+            self.tracer.end_all("server lost")
+        self.port_events.clear()
+        self.removed_edges.clear()
+        self.edges = EdgeTable()
+        self.created_edges = set()
+
+        # opening the client blocks while waiting for the server, so it runs on a thread
+        connected = await self.loop.run_in_executor(
+            None, self.connect_to_jack_server, self.clientname, self.servername, None
+        )
+        if not connected:
+            return
+        self.server_lost.clear()
+        self.activate_client()
+        self.reconnect_stats["reconnects"] += 1
+        log.info("reconnected to jack server")
+        self.set_initial_connections()
+        self.progress_changed()
+        self.check_convergence()
+
+    def is_converged(self) -> bool:
+        """True if all wanted connections between existing ports are established"""
+        return self.queue.empty() and self.edges.converged()
+
+    def is_healthy(self, max_delay: float) -> bool:
+        """False if the queued edges aren't connected anymore or a reconcile pass
+        is overdue by more than max_delay seconds, has to be called on the loop"""
+        if self.worker is not None and self.worker.done():
+            return False
+        return (
+            self.reconcile_timer is None
+            or self.loop.time() - self.reconcile_due < max_delay
+        )
+
+    def progress(self) -> str:
+        """the state of the wanted connections in a line, e.g. for systemd"""
+        if self.server_lost.is_set():
+            return "jack server lost, reconnecting"
+        counts = self.edges.counts
+        progress = (
+            f"{counts[EdgeState.CONNECTED]}/{len(self.edges)} edges, "
+            f"{counts[EdgeState.PENDING]} pending"
+        )
+        if counts[EdgeState.FAILED]:
+            progress += f", {counts[EdgeState.FAILED]} failed"
+        return progress
+
+    def progress_changed(self):
+        for listener in self.progress_listeners:
+            listener()
+
+    def check_convergence(self):
+        if not self.is_converged():
+            return
+
+        self.converged_at = monotonic()
+        if self.tracer is not None:
+            self.tracer.schedule_write()
+        log.info(
+            f"all {self.edges.counts[EdgeState.CONNECTED]} connections are established"
+        )
+        if self.server_lost_at is not None and not self.server_lost.is_set():
+            self.reconnect_stats["reconverge_time"] = monotonic() - self.server_lost_at
+            self.server_lost_at = None
+            log.info(
+                "converged again "
+                f"{self.reconnect_stats['reconverge_time']:.2f} s after the server shutdown"
+            )
+        converge_times = self.queue.converge_times
+        if len(converge_times) > 1:
+            log.info(
+                "time to converge by priority: "
+                + ", ".join(
+                    f"{converge_times[p]*1000:.1f} ms (priority {p})"
+                    for p in sorted(converge_times, reverse=True)
                 )
+            )
+        self.progress_changed()
 
-                for i in range(n_channels):
-                    source_port = f"{source_base}{source_start_index+i}"
-                    sink_port = f"{sink_base}{sink_start_index+i}"
-                    log.debug(f"parsing connection {source_port} -> {sink_port}")
-                    add_to_dict_of_sets(self.source_ports, source_port, sink_port)
-                    add_to_dict_of_sets(self.all_ports, sink_port, source_port)
-                    add_to_dict_of_sets(self.all_ports, source_port, sink_port)
+    def edge_priority(self, edge: tuple[str, str]) -> int:
+        return self.rules.priority(*edge)
 
-    def set_initial_connections(self):
-        for source in self.source_ports:
-            try:
-                source_port = self.c.get_port_by_name(source)
-            except jack.JackError:
+    def compile_rules(self, rules, profile: str | None = None) -> RuleIndex:
+        if self.shared_rules is not None:
+            return self.shared_rules.index(self.config_path, rules, profile)
+        return RuleIndex(rules)
+
+    def compile_profiles(self, config: Config) -> dict[str | None, RuleIndex]:
+        """compiles the rules of every profile up front, so switching doesn't have to"""
+        if not config.profiles:
+            return {None: self.compile_rules(config.rules)}
+        return {
+            name: self.compile_rules(config.profile_rules(name), name)
+            for name in config.profiles
+        }
+
+    def build_connection_dict(self, config_path: Path, use_cache: bool = True):
+        config = load_config(config_path, use_cache)
+        # raises ProfileError for an unknown profile
+        config.profile_rules(self.profile)
+        if self.profile is None:
+            self.profile = config.default_profile
+        self.profile_indexes = self.compile_profiles(config)
+        self.rules = self.profile_indexes[self.profile]
+        for rule in self.rules.rules:
+            log.debug(f"parsing rule {rule}")
+
+    def reload(self):
+        """reads the connection file again and only applies the rules that changed"""
+        t_start = perf_counter()
+        try:
+            config = load_config(self.config_path, self.use_config_cache)
+        except Exception as e:
+            log.error(f"could not reload {self.config_path}, keeping old config: {e}")
+            return
+
+        profile = self.profile
+        if profile is None:
+            profile = config.default_profile
+        elif profile not in config.profiles:
+            log.error(
+                f"profile {profile} was removed from {self.config_path}, keeping old config"
+            )
+            return
+        self.profile_indexes = self.compile_profiles(config)
+        self.profile = profile
+        rules = self.profile_indexes[profile]
+
+        if set(rules.rules) == set(self.rules.rules):
+            self.rules = rules
+            log.info("config reloaded, no rules changed")
+            return
+
+        n_added, n_removed, n_pruned, n_queued = self.apply_rules(
+            rules, prune_connected=self.strict
+        )
+        if n_queued is None:
+            log.info("config reloaded, it is applied once the jack server is back")
+            return
+        log.info(
+            f"config reloaded: {n_added} rules added, {n_removed} removed, "
+            f"queued {n_queued} connections, removed {n_pruned} connections "
+            f"in {(perf_counter() - t_start)*1000:.1f} ms"
+        )
+
+    def apply_rules(self, rules: RuleIndex, prune_connected: bool):
+        """replaces the rules and only changes the connections of the rules that differ.
+        connections of removed rules are disconnected first if prune_connected is set,
+        otherwise only with prune_on_reload if they were made by the connection manager.
+        returns the numbers of added and removed rules, of disconnected and of queued
+        connections, which is None if the server is lost."""
+        old_rules = set(self.rules.rules)
+        new_rules = set(rules.rules)
+        added = new_rules - old_rules
+        removed = old_rules - new_rules
+        self.rules = rules
+        if self.server_lost.is_set():
+            return len(added), len(removed), 0, None
+
+        n_pruned = 0
+        # the edges of pattern rules are those of the ports in the graph
+        for a, b in RuleIndex(list(removed)).edges(self.graph.ports):
+            # the edge might still be wanted by another rule
+            if b in self.rules.peers(a):
                 continue
+            for edge in ((a, b), (b, a)):
+                self.retries.cancel(edge)
+                state = self.edges.get(edge)
+                self.edges.remove(edge)
+                if prune_connected:
+                    # the connection is removed no matter who made it
+                    prune = state == EdgeState.CONNECTED and not self.is_excluded(edge)
+                else:
+                    prune = self.prune_on_reload and edge in self.created_edges
+                if prune:
+                    n_pruned += self.disconnect(edge)
+                self.created_edges.discard(edge)
+
+        n_queued = self.queue_edges(
+            self.graph, set(RuleIndex(list(added)).edges(self.graph.ports))
+        )
+        return len(added), len(removed), n_pruned, n_queued
+
+    def switch_profile(self, profile: str) -> dict[str, float]:
+        """switches to the precompiled rules of another profile. connections that
+        both profiles share are left alone, the others are disconnected and connected
+        in one batch. connects that don't fit into profile_switch_time are queued.
+        returns the number of operations and the duration in seconds."""
+        t_start = perf_counter()
+        if profile not in self.profile_indexes or profile is None:
+            raise ProfileError(
+                f"unknown profile {profile!r}, known profiles: "
+                f"{', '.join(p for p in self.profile_indexes if p is not None) or 'none'}"
+            )
+        self.profile = profile
+        _, _, n_disconnected, n_queued = self.apply_rules(
+            self.profile_indexes[profile], prune_connected=True
+        )
+        n_connected = 0
+        if n_queued:
+            deadline = perf_counter() + profile_switch_time
+            while not self.queue.empty() and perf_counter() < deadline:
+                self.connect_edge(self.queue.get_nowait())
+                n_connected += 1
+        duration = perf_counter() - t_start
+
+        stats = {
+            "disconnected": n_disconnected,
+            "connected": n_connected,
+            "queued": self.queue.qsize(),
+            "duration": duration,
+        }
+        self.profile_stats.update(stats)
+        self.profile_stats["switches"] += 1
+        log.info(
+            f"switched to profile {profile}: disconnected {n_disconnected}, "
+            f"connected {n_connected}, queued {stats['queued']} connections "
+            f"in {duration*1000:.1f} ms"
+        )
+        return stats
+
+    def next_profile(self, *args):
+        """switches to the profile after the active one in the connection file"""
+        profiles = [p for p in self.profile_indexes if p is not None]
+        if not profiles:
+            log.warning("the connection file has no profiles to switch to")
+            return
+        i = profiles.index(self.profile) if self.profile in profiles else -1
+        self.switch_profile(profiles[(i + 1) % len(profiles)])
+
+    def desired_edges(self):
+        """yields all (source, sink) port name tuples from the connection file,
+        pattern rules are matched against the ports of the graph mirror"""
+        return self.rules.edges(self.graph.ports)
+
+    def set_initial_connections(self) -> int:
+        """reads the jack graph once into the graph mirror and queues all missing
+        connections. in strict mode, connections that are not in the connection file
+        are removed. returns the number of queued connections."""
+        t_start = perf_counter()
+        self.graph = GraphMirror(self.c)
+        t_snapshot = perf_counter()
+        edges = dict(self.graph.directed_edges(self.desired_edges()))
+        unexpected = []
+        if self.strict:
+            unexpected = removal_plan(
+                [e for e in self.graph.connections if self.graph.ports[e[0]].is_audio],
+                self.exclude,
+                self.rules,
+            )
+        t_diff = perf_counter()
+        n_queued = self.queue_edges(self.graph, edges)
+        n_removed = sum(self.disconnect(edge) for edge in unexpected)
+        self.strict_stats["removed"] += n_removed
+        t_apply = perf_counter()
+
+        self.sync_timings = {
+            "snapshot": t_snapshot - t_start,
+            "diff": t_diff - t_snapshot,
+            "apply": t_apply - t_diff,
+        }
+        log.info(
+            f"initial sync queued {n_queued} connections, "
+            f"removed {n_removed} unexpected connections "
+            f"(snapshot {self.sync_timings['snapshot']*1000:.1f} ms, "
+            f"diff {self.sync_timings['diff']*1000:.1f} ms, "
+            f"apply {self.sync_timings['apply']*1000:.1f} ms)"
+        )
+        return n_queued
+
+    def resync(self) -> int:
+        """reads the graph again and queues all missing connections right away,
+        including those waiting for a retry or that ran out of retries"""
+        self.retries.cancel_all()
+        for edge in self.edges.edges_in((EdgeState.PENDING, EdgeState.FAILED)):
+            self.edges.update(edge, EdgeState.DESIRED)
+        return self.set_initial_connections()
 
-            self.set_connection_for_port(source_port)
+    def queue_edges(self, snapshot: GraphSnapshot, edges) -> int:
+        """records the state of the (source, sink) edges in the edge table
+        and queues the ones that aren't connected. returns the number of queued edges.
+        """
+        n_queued = 0
+        for edge, connected in snapshot.directed_edges(edges):
+            if connected:
+                self.edges.set(edge, EdgeState.CONNECTED)
+            elif self.edges.get(edge) != EdgeState.PENDING:
+                log.debug(f"connecting {edge[0]} -> {edge[1]}")
+                self.edges.set(edge, EdgeState.PENDING)
+                self.queue.put_nowait(edge)
+                n_queued += 1
+        return n_queued
 
-    def set_connection_for_port(self, port: jack.Port, registered: bool = True):
+    def hand_over(self, callback: Callable, *args):
+        """runs callback on the loop like call_threadsafe, but wakes up the loop
+        only once for a burst of calls instead of for every call"""
+        self.incoming.append((callback, *args))
+        self.wake_loop()
+
+    def wake_loop(self):
+        if not self.incoming_scheduled:
+            self.incoming_scheduled = True
+            self.call_threadsafe(self.run_handed_over)
+
+    def run_handed_over(self):
+        # cleared before draining, so calls appended meanwhile are either
+        # run now or schedule another drain
+        self.incoming_scheduled = False
+        while self.incoming:
+            callback, *args = self.incoming.popleft()
+            callback(*args)
+
+    def port_registration_callback(self, port: "jack.Port | None", registered: bool):
+        """runs on the jack notification thread, so it only hands the port to the loop"""
+        if port is None:
+            # with only_available=False, the port can be gone by the time jack-client
+            # looks it up, so it is found by comparing the mirror with the graph
+            self.hand_over(self.schedule_graph_check)
+            return
+        self.incoming.append((self.port_event, port.name, registered, port))
+        if self.tracer is not None:
+            self.tracer.port_registered(port.name, registered)
+        self.wake_loop()
+
+    def port_connect_callback(
+        self, a: "jack.Port | None", b: "jack.Port | None", connect: bool
+    ):
+        """runs on the jack notification thread, only updates the edge table
+        and hands the change to the loop for the graph mirror and the strict mode"""
+        if a is None or b is None:
+            self.hand_over(self.schedule_graph_check)
+            return
+        a_name = a.name
+        b_name = b.name
+        edge = (a_name, b_name)
+        if self.edges.get(edge) is None:
+            edge = (b_name, a_name)
+        if connect:
+            self.edges.update(edge, EdgeState.CONNECTED)
+        else:
+            self.edges.update(edge, EdgeState.DESIRED, expected=EdgeState.CONNECTED)
+        self.incoming.append((self.connection_event, a_name, b_name, connect))
+        self.wake_loop()
+
+    def port_rename_callback(self, port: "jack.Port | None", old: str, new: str):
+        self.hand_over(self.port_renamed, old, new)
+
+    def client_registration_callback(self, name: str, registered: bool):
         if not registered:
+            self.hand_over(self.client_unregistered, name)
+
+    def connection_event(self, a: str, b: str, connected: bool):
+        edge = self.graph.directed_edge(a, b)
+        if edge is None:
+            # a port the mirror doesn't know, e.g. one that was removed since
             return
+        if connected:
+            self.graph.connect(*edge)
+            if self.tracer is not None:
+                self.tracer.end(edge, "confirmed")
+        else:
+            self.graph.disconnect(*edge)
+            if self.edges.get(edge) is not None:
+                # a wanted connection was removed by someone else
+                self.progress_changed()
+        if self.strict and self.graph.ports[edge[0]].is_audio:
+            self.enforce_edge(*edge, connected)
+
+    def port_renamed(self, old: str, new: str):
+        """jack keeps the connections of a renamed port, but the rules
+        that match it can change like for an unregistered and a new port"""
+        self.graph.rename_port(old, new)
+        self.port_event(old, False)
+        self.port_event(new, True)
+
+    def client_unregistered(self, name: str):
+        # jack unregisters the ports of the client first, this only catches stragglers
+        self.graph.remove_client(name)
+
+    def is_excluded(self, edge: tuple[str, str]) -> bool:
+        return edge[0].startswith(self.exclude) or edge[1].startswith(self.exclude)
 
-        if not port.name in self.all_ports:
+    def disconnect(self, edge: tuple[str, str]) -> bool:
+        try:
+            self.c.disconnect(*edge)
+        except self.jack.JackError as e:
+            log.warning(f"could not disconnect {edge[0]} -> {edge[1]}: {e}")
+            return False
+        self.graph.disconnect(*edge)
+        return True
+
+    def enforce_edge(self, out_port: str, in_port: str, connected: bool):
+        """strict mode: reverts a connection change that doesn't match the connection file,
+        decided by a lookup in the rule index without reading the graph.
+        unexpected connections are removed right away, removed ones are restored
+        by the next reconcile pass."""
+        edge = (out_port, in_port)
+        if self.server_lost.is_set() or self.is_excluded(edge):
             return
 
-        sinks = self.all_ports[port.name]
-        connections = self.c.get_all_connections(port)
+        wanted = in_port in self.rules.peers(out_port)
+        if connected and not wanted:
+            log.info(f"removing unexpected connection {out_port} -> {in_port}")
+            self.strict_stats["removed"] += self.disconnect(edge)
+        elif not connected and wanted and self.edges.get(edge) == EdgeState.DESIRED:
+            # jack disconnects the ports of a closing client before unregistering
+            # them, so the restore waits for the reconcile pass to see if they stay
+            self.removed_edges.append(edge)
+            self.schedule_reconcile()
 
-        for sink in sinks:
-            try:
-                sink_port = self.c.get_port_by_name(sink)
-            except jack.JackError:
+    def restore_edges(self, edges: list[tuple[str, str]]):
+        """strict mode: queues the removed connections whose ports still exist"""
+        for edge in edges:
+            if (
+                self.edges.get(edge) != EdgeState.DESIRED
+                or edge in self.graph.connections
+                or edge[0] not in self.graph.ports
+                or edge[1] not in self.graph.ports
+            ):
                 continue
+            log.info(f"restoring removed connection {edge[0]} -> {edge[1]}")
+            self.strict_stats["restored"] += 1
+            self.edges.set(edge, EdgeState.PENDING)
+            self.queue.put_nowait(edge)
 
-            if sink_port not in connections:
-                log.debug(f"connecting {port.name} -> {sink_port.name}")
-                if port.is_output:
-                    self.queue.put((port, sink_port, n_retries))
-                else:
-                    self.queue.put((sink_port, port, n_retries))
+    def port_event(
+        self, port_name: str, registered: bool, port: "jack.Port | None" = None
+    ):
+        """updates the graph mirror with a port registration from the callback
+        right away and collects it, bursts of them are coalesced into
+        a single reconcile pass"""
+        if port is not None:
+            if registered:
+                self.graph.add_port(port_name, port.is_output, port.is_audio)
+            else:
+                self.graph.remove_port(port_name)
+        self.port_events.append((port_name, registered))
+        self.schedule_reconcile()
 
-    def connection_loop(self):
-        """main loop that checks if new connections were put into the conection queue"""
-        while not self.stop_event.is_set():
-            try:
-                out_port, in_port, retries_remaining = self.queue.get(timeout=1)
-            except queue.Empty:
-                continue
-            except TypeError:
-                log.error("TypeError while unpacking ports from queue...")
-                continue
+    def schedule_reconcile(self):
+        """runs a reconcile pass once no event arrived for coalesce_window seconds,
+        at most coalesce_max_latency seconds after the first one"""
+        now = self.loop.time()
+        if self.reconcile_timer is None:
+            self.reconcile_deadline = now + self.coalesce_max_latency
+            self.reconcile_due = min(
+                now + self.coalesce_window, self.reconcile_deadline
+            )
+            self.reconcile_timer = self.loop.call_at(self.reconcile_due, self.reconcile)
+        else:
+            # the timer is moved in reconcile() instead of being replaced for every event
+            self.reconcile_due = min(
+                now + self.coalesce_window, self.reconcile_deadline
+            )
+
+    def reconcile(self):
+        if self.loop.time() < self.reconcile_due:
+            self.reconcile_timer = self.loop.call_at(self.reconcile_due, self.reconcile)
+            return
+
+        self.reconcile_timer = None
+        events, self.port_events = self.port_events, []
+        removed_edges, self.removed_edges = self.removed_edges, []
+        t_start = perf_counter()
+        try:
+            self.reconcile_ports(events)
+        except self.jack.JackError as e:
+            log.error(f"could not reconcile ports: {e}")
+        if removed_edges and not self.server_lost.is_set():
+            self.restore_edges(removed_edges)
+        self.progress_changed()
+        if self.tracer is not None:
+            self.tracer.reconcile(t_start, len(events))
 
+    def reconcile_ports(self, events: list[tuple[str, bool]]):
+        """queues the missing connections of all ports in one pass over the graph mirror"""
+        # only the latest event of a port is relevant
+        latest = dict(events)
+        registered = []
+        for port_name, is_registered in latest.items():
+            if not is_registered:
+                self.forget_port(port_name)
+            elif port_name in self.rules:
+                registered.append(port_name)
+
+        self.reconcile_stats["events"] += len(events)
+        self.reconcile_stats["passes"] += 1
+        log.debug(
+            f"reconciling {len(registered)} ports from {len(events)} events "
+            f"({self.reconcile_stats['passes']} passes for "
+            f"{self.reconcile_stats['events']} events so far)"
+        )
+        if not registered or self.server_lost.is_set():
+            # after a server shutdown the graph is synced completely when reconnecting
+            return
+
+        edges = (
+            (port_name, peer)
+            for port_name in registered
+            for peer in self.rules.peers(port_name, self.graph.ports)
+        )
+        self.queue_edges(self.graph, edges)
+
+    def forget_port(self, port_name: str):
+        """drops the edges of a port that went away, they are added again
+        from the rules if it is registered again"""
+        self.retries.cancel_port(port_name)
+        self.created_edges.difference_update(self.edges.remove_port(port_name))
+
+    def schedule_graph_check(self):
+        """runs the graph check soon instead of at its next interval,
+        e.g. after a notification for a port jack-client couldn't look up"""
+        if self.graph_check_timer is None:
+            # not running yet, the initial sync reads the whole graph anyway
+            return
+        due = self.loop.time() + self.coalesce_window
+        if self.graph_check_timer.when() > due:
+            self.graph_check_timer.cancel()
+            self.graph_check_timer = self.loop.call_at(due, self.check_graph)
+
+    def check_graph(self):
+        """compares the graph mirror with a fresh snapshot of the graph and replaces it
+        if they differ, e.g. because a notification was missed"""
+        self.graph_check_timer = self.loop.call_later(
+            graph_check_interval, self.check_graph
+        )
+        if self.server_lost.is_set():
+            return
+        # notifications that already arrived are applied first
+        self.run_handed_over()
+        try:
+            graph = GraphMirror(self.c)
+        except self.jack.JackError as e:
+            log.warning(f"could not check the graph mirror: {e}")
+            return
+
+        n_ports, n_connections = self.graph.drift(graph)
+        if not n_ports and not n_connections:
+            log.debug("graph mirror is consistent with the graph")
+            return
+        log.warning(
+            f"graph mirror differed in {n_ports} ports and {n_connections} connections, "
+            "replacing it"
+        )
+        self.graph_stats["corrected"] += n_ports + n_connections
+        gone = self.graph.ports.keys() - graph.ports.keys()
+        self.graph = graph
+        for port_name in gone:
+            self.forget_port(port_name)
+        self.queue_edges(graph, self.desired_edges())
+
+    def connect_edge(self, edge: tuple[str, str]):
+        # the edge might have been removed from the config or lost a port since it was queued
+        state = self.edges.get(edge)
+        if state != EdgeState.PENDING:
+            if self.tracer is not None:
+                self.tracer.end(edge, "removed" if state is None else state.value)
+            # e.g. the callback confirmed a connection made by someone else while it
+            # was queued, the last queued edge still completes the convergence
+            self.check_convergence()
+            return
+
+        if edge in self.graph.connections:
+            # connected meanwhile, e.g. by another client, jack would answer with error 17
+            self.graph_stats["skipped_connects"] += 1
+            if self.tracer is not None:
+                self.tracer.end(edge, "already connected")
+        else:
+            t_start = perf_counter()
             try:
-                self.c.connect(out_port, in_port)
-            except jack.JackErrorCode as e:
+                self.c.connect(*edge)
+            except self.jack.JackErrorCode as e:
+                self.metrics.connect_latency.observe(perf_counter() - t_start)
+                if self.tracer is not None:
+                    self.tracer.connect(edge, t_start, e.code)
                 # handle connection already existing
-                if e.code == 17:
-                    pass
-                else:
-                    if retries_remaining > 0:
+                if e.code != 17:
+                    if self.retries.schedule(edge):
+                        self.metrics.retries.inc(e.code)
                         log.warning(
                             f"Jack-Error {e.code} while setting connection: {e.message}, retrying..."
                         )
-                        t = Timer(
-                            retry_timer,
-                            self.queue.put,
-                            args=((out_port, in_port, retries_remaining - 1),),
-                        )
-                        t.start()
                     else:
+                        self.metrics.failures.inc(e.code)
                         log.error(
                             f"Jack-Error {e.code} while setting connection: {e.message}"
                         )
+                        self.edges.update(edge, EdgeState.FAILED)
+                        self.progress_changed()
+                        if self.tracer is not None:
+                            self.tracer.end(edge, "failed")
+                    return
+                if self.tracer is not None:
+                    # jack doesn't notify about a connection that already existed
+                    self.tracer.end(edge, "already connected")
+            else:
+                self.metrics.connect_latency.observe(perf_counter() - t_start)
+                if self.tracer is not None:
+                    self.tracer.connect(edge, t_start)
+                self.created_edges.add(edge)
+            self.graph.connect(*edge)
 
-    def print_missing_connections(self):
-        missing_ports = set()
-        missing_connections = set()
-        for source in self.source_ports:
-            try:
-                source_port = self.c.get_port_by_name(source)
-            except jack.JackError:
-                print(f"missing port: {source}")
-                missing_ports.add(source)
-                continue
+        self.retries.cancel(edge)
+        self.edges.update(edge, EdgeState.CONNECTED)
+        self.check_convergence()
+
+    async def connect_queued_edges(self):
+        while True:
+            for _ in range(connect_batch_size):
+                # returns without suspending while the queue isn't empty
+                edge = await self.queue.get()
+                # edges queued before a server shutdown are dropped, reconnecting resyncs them
+                if not self.server_lost.is_set():
+                    self.connect_edge(edge)
+            self.progress_changed()
+            # let timers, jack callbacks and signals run during long bursts of connects
+            await asyncio.sleep(0)
 
-            sinks = self.source_ports[source]
-            connections = self.c.get_all_connections(source_port)
+    async def run(self):
+        self.worker = self.loop.create_task(self.connect_queued_edges())
+        self.graph_check_timer = self.loop.call_later(
+            graph_check_interval, self.check_graph
+        )
+        await self.stop_requested.wait()
 
-            for sink in sinks:
-                try:
-                    sink_port = self.c.get_port_by_name(sink)
-                except jack.JackError:
-                    print(f"missing port: {sink}")
-                    missing_ports.add(sink)
-                    continue
+        tasks = [self.worker]
+        if self.reconnect_task is not None:
+            tasks.append(self.reconnect_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.reconcile_timer is not None:
+            self.reconcile_timer.cancel()
+        self.graph_check_timer.cancel()
+        self.retries.stop()
+        self.watcher.stop()
+        for service in self.services:
+            service.stop()
 
-                if sink_port not in connections:
-                    print(f"missing connection {source_port.name} -> {sink_port.name}")
-                    missing_connections.add((source, sink))
-        return missing_ports, missing_connections
+    def connection_loop(self):
+        """runs the event loop until deactivate() is called.
+        without events the loop sleeps, there is no polling."""
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
+
+    def render_metrics(self, const_labels=()) -> str:
+        """returns the metrics in the prometheus text format,
+        const_labels are (name, value) tuples added to every sample"""
+        prefix = "jack_connection_manager"
+        counts = self.edges.counts
+        converged = self.is_converged()
+        if converged:
+            unconverged_for = 0.0
+        else:
+            unconverged_for = monotonic() - (self.converged_at or self.started_at)
+        reconverge_time = self.reconnect_stats["reconverge_time"]
+
+        lines = [
+            *samples(
+                f"{prefix}_queue_depth",
+                "gauge",
+                "Connections waiting in the connection queue.",
+                {(): self.queue.qsize()},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_retries_pending",
+                "gauge",
+                "Connections waiting for a retry.",
+                {(): len(self.retries.pending)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_edges",
+                "gauge",
+                "Wanted connections between existing ports by state.",
+                {(state.value,): counts[state] for state in EdgeState},
+                ("state",),
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_desired_edges",
+                "gauge",
+                "Wanted connections between existing ports.",
+                {(): len(self.edges)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_established_edges",
+                "gauge",
+                "Wanted connections that are established.",
+                {(): counts[EdgeState.CONNECTED]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_converged",
+                "gauge",
+                "1 if all wanted connections are established.",
+                {(): int(converged)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_seconds_since_convergence",
+                "gauge",
+                "Time since all wanted connections were last established, 0 while they are.",
+                {(): round(unconverged_for, 3)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_reconnects_total",
+                "counter",
+                "Number of reconnects after the jack server shut down.",
+                {(): self.reconnect_stats["reconnects"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_reconverge_seconds",
+                "gauge",
+                "Time from the last jack server shutdown until all wanted connections were established again.",
+                {} if reconverge_time is None else {(): round(reconverge_time, 3)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_port_events_total",
+                "counter",
+                "Port registrations and unregistrations handed to the reconcile passes.",
+                {(): self.reconcile_stats["events"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_reconcile_passes_total",
+                "counter",
+                "Reconcile passes run for the port events, bursts are coalesced into one.",
+                {(): self.reconcile_stats["passes"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_strict_corrections_total",
+                "counter",
+                "Connections removed or restored by the strict mode.",
+                {(action,): n for action, n in self.strict_stats.items()},
+                ("action",),
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_skipped_connects_total",
+                "counter",
+                "Connects skipped because the graph mirror had the connection already.",
+                {(): self.graph_stats["skipped_connects"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_graph_corrections_total",
+                "counter",
+                "Ports and connections the graph mirror missed, found by its consistency check.",
+                {(): self.graph_stats["corrected"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_profile_switches_total",
+                "counter",
+                "Number of switches between profiles of the connection file.",
+                {(): self.profile_stats["switches"]},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_profile_switch_operations",
+                "gauge",
+                "Connections changed by the last profile switch, queued ones were made afterwards.",
+                {
+                    (operation,): self.profile_stats[operation]
+                    for operation in ("disconnected", "connected", "queued")
+                },
+                ("operation",),
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_profile_switch_duration_seconds",
+                "gauge",
+                "Duration of the last profile switch.",
+                {(): round(self.profile_stats["duration"], 6)},
+                const_labels=const_labels,
+            ),
+            *samples(
+                f"{prefix}_priority_converge_seconds",
+                "gauge",
+                "Time from the first queued connection of a priority until its last one was taken from the queue.",
+                {(str(p),): round(t, 6) for p, t in self.queue.converge_times.items()},
+                ("priority",),
+                const_labels=const_labels,
+            ),
+            *self.metrics.connect_latency.render(const_labels),
+            *self.metrics.retries.render(const_labels),
+            *self.metrics.failures.render(const_labels),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def print_missing_connections(self):
+        result = check(self.graph, self.rules)
+        output = format_text(result)
+        if output:
+            print(output)
+        return set(result.missing_ports), set(result.missing_connections)
 
     def deactivate(self, *args):
+        """stops the connection manager, can be called from any thread"""
         log.info("received deactivation signal")
         self.stop_event.set()
+        self.call_threadsafe(self.stop_requested.set)
         self.c.deactivate()
@@ -1,3 +1,7 @@
 
-from . import _version
-__version__ = _version.get_versions()['version']
+def __getattr__(name):
+    # looked up on first use, in a git checkout versioneer runs git to find the version
+    if name == '__version__':
+        from . import _version
+        return _version.get_versions()['version']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
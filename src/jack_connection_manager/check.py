@@ -0,0 +1,124 @@
+import json
+import logging
+from enum import IntEnum
+from pathlib import Path
+from typing import NamedTuple
+
+from jack_connection_manager.config import load_rules
+from jack_connection_manager.graph import GraphSnapshot
+from jack_connection_manager.rules import RuleIndex
+
+log = logging.getLogger()
+
+
+class Severity(IntEnum):
+    """exit codes of the check, following the nagios plugin convention"""
+
+    OK = 0
+    # ports of the connection file are missing, e.g. because a client isn't running
+    WARNING = 1
+    # connections between existing ports are missing
+    CRITICAL = 2
+    # the jack server couldn't be reached or the connection file couldn't be read
+    UNKNOWN = 3
+
+
+class CheckResult(NamedTuple):
+    n_edges: int
+    n_connected: int
+    missing_ports: list[str]
+    # (output, input) connections between existing ports that aren't made
+    missing_connections: list[tuple[str, str]]
+
+    @property
+    def severity(self) -> Severity:
+        if self.missing_connections:
+            return Severity.CRITICAL
+        if self.missing_ports:
+            return Severity.WARNING
+        return Severity.OK
+
+
+def check(snapshot: GraphSnapshot, rules: RuleIndex) -> CheckResult:
+    """compares the connection file with a snapshot or a mirror of the graph"""
+    missing_ports = set()
+    missing_connections = []
+    n_edges = n_connected = 0
+    # rules can overlap, so edges are deduplicated
+    for a, b in set(rules.edges(snapshot.ports)):
+        n_edges += 1
+        edge = snapshot.directed_edge(a, b)
+        if edge is None:
+            missing_ports.update(p for p in (a, b) if p not in snapshot.ports)
+        elif edge in snapshot.connections:
+            n_connected += 1
+        else:
+            missing_connections.append(edge)
+    return CheckResult(
+        n_edges, n_connected, sorted(missing_ports), sorted(missing_connections)
+    )
+
+
+def format_text(result: CheckResult) -> str:
+    lines = [f"missing port: {port}" for port in result.missing_ports]
+    lines += [f"missing connection {a} -> {b}" for a, b in result.missing_connections]
+    return "\n".join(lines)
+
+
+def format_tsv(result: CheckResult) -> str:
+    lines = [f"port\t{port}" for port in result.missing_ports]
+    lines += [f"connection\t{a}\t{b}" for a, b in result.missing_connections]
+    return "\n".join(lines)
+
+
+def format_json(result: CheckResult) -> str:
+    return json.dumps(
+        {
+            "status": result.severity.name.lower(),
+            "edges": result.n_edges,
+            "connected": result.n_connected,
+            "missing_ports": result.missing_ports,
+            "missing_connections": result.missing_connections,
+        }
+    )
+
+
+formats = {"text": format_text, "tsv": format_tsv, "json": format_json}
+
+
+def run_check(
+    config_path: Path,
+    clientname: str,
+    output_format: str = "text",
+    use_config_cache: bool = True,
+    servername: str | None = None,
+    backend=None,
+    profile: str | None = None,
+) -> Severity:
+    """prints the missing ports and connections in the output format and returns the severity.
+    opens a client only to read the graph, it is never activated."""
+    # errors in the connection file are reported without loading libjack
+    try:
+        rules = RuleIndex(load_rules(config_path, use_config_cache, profile))
+    except (OSError, ValueError) as e:
+        # e.g. a ConfigError or ProfileError, which must not look like missing ports
+        log.error(f"could not read {config_path}: {e}")
+        return Severity.UNKNOWN
+    if backend is None:
+        import jack as backend
+    try:
+        client = backend.Client(clientname, no_start_server=True, servername=servername)
+    except backend.JackOpenError as e:
+        log.error(f"could not connect to jack server: {e}")
+        return Severity.UNKNOWN
+    try:
+        # the client only reads the graph and doesn't need to be activated,
+        # the connections of all outputs are read if there are pattern rules
+        result = check(GraphSnapshot(client, rules.sources()), rules)
+    finally:
+        client.close()
+
+    output = formats[output_format](result)
+    if output:
+        print(output)
+    return result.severity
@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import marshal
+import os
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+from jack_connection_manager.rules import PatternRule, Rule, RuleIndex, parse_config
+
+log = logging.getLogger()
+
+# bump when the layout of the cached data changes
+cache_format = 4
+cache_magic = b"JCMCACHE"
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class ConfigError(ValueError):
+    """the connection file is no valid yaml or misses required keys"""
+
+
+class Config(NamedTuple):
+    """the rules of a connection file. rules are active in every profile,
+    the rules of a profile only while it is selected."""
+
+    rules: list[Rule | PatternRule]
+    profiles: dict[str, list[Rule | PatternRule]]
+    # profile used if none is selected, None if the file has no profiles
+    default_profile: str | None
+
+    def profile_rules(self, profile: str | None = None) -> list[Rule | PatternRule]:
+        """returns the rules active with the profile, None selects the default profile"""
+        if profile is None:
+            profile = self.default_profile
+            if profile is None:
+                return self.rules
+        try:
+            return self.rules + self.profiles[profile]
+        except KeyError:
+            raise ProfileError(
+                f"unknown profile {profile!r}, known profiles: "
+                f"{', '.join(self.profiles) or 'none'}"
+            ) from None
+
+
+def package_version() -> str:
+    # importlib.metadata is slow to import and only needed for the cache key
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("jack_connection_manager")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def cache_paths(config_path: Path) -> list[Path]:
+    """possible locations of the cache file, next to the config first"""
+    user_cache = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    path_hash = hashlib.sha256(str(config_path.resolve()).encode()).hexdigest()[:16]
+    return [
+        config_path.parent / f".{config_path.name}.cache",
+        user_cache / "jack-connection-manager" / f"{path_hash}.cache",
+    ]
+
+
+def cache_key(content: bytes) -> bytes:
+    h = hashlib.sha256(content)
+    h.update(f"{cache_format}:{marshal.version}:{package_version()}".encode())
+    return h.digest()
+
+
+def cached_rule(rule: tuple) -> Rule | PatternRule:
+    return PatternRule(*rule) if len(rule) == len(PatternRule._fields) else Rule(*rule)
+
+
+def read_cache(path: Path, key: bytes) -> Config | None:
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+
+    header = cache_magic + key
+    if not data.startswith(header):
+        return None
+    try:
+        rules, profiles, default_profile = marshal.loads(data[len(header) :])
+        return Config(
+            [cached_rule(rule) for rule in rules],
+            {
+                name: [cached_rule(rule) for rule in profile_rules]
+                for name, profile_rules in profiles.items()
+            },
+            default_profile,
+        )
+    except (EOFError, ValueError, TypeError):
+        log.warning(f"ignoring corrupt config cache {path}")
+        return None
+
+
+def write_cache(paths: list[Path], key: bytes, config: Config):
+    data = (
+        cache_magic
+        + key
+        + marshal.dumps(
+            (
+                [tuple(rule) for rule in config.rules],
+                {
+                    name: [tuple(rule) for rule in rules]
+                    for name, rules in config.profiles.items()
+                },
+                config.default_profile,
+            )
+        )
+    )
+    for path in paths:
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+            log.debug(f"wrote config cache {path}")
+            return
+        except OSError as e:
+            log.debug(f"could not write config cache {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+
+def parse_yaml(content: bytes) -> Config:
+    import yaml
+
+    # prefer the libyaml based loader, it is a lot faster
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    try:
+        conf = yaml.load(content, loader) or []
+    except yaml.YAMLError as e:
+        raise ConfigError(f"invalid yaml: {e}") from None
+    try:
+        return parse_conf(conf)
+    except KeyError as e:
+        raise ConfigError(f"missing key {e}") from None
+    except (AttributeError, TypeError) as e:
+        raise ConfigError(f"unexpected structure: {e}") from None
+
+
+def parse_conf(conf: list | dict) -> Config:
+    if not isinstance(conf, dict):
+        return Config(parse_config(conf), {}, None)
+
+    # a file with profiles, see the readme
+    profiles = {
+        str(name): parse_config(rules or [])
+        for name, rules in (conf.get("profiles") or {}).items()
+    }
+    default_profile = conf.get("default_profile", next(iter(profiles), None))
+    config = Config(parse_config(conf.get("connections") or []), profiles, None)
+    if default_profile is not None:
+        # raises ProfileError for an unknown default profile
+        config.profile_rules(str(default_profile))
+        config = config._replace(default_profile=str(default_profile))
+    return config
+
+
+def load_config(config_path: Path, use_cache: bool = True) -> Config:
+    """reads the rules of all profiles from a connection file.
+    the parsed rules are cached and reused as long as the file doesn't change."""
+    config_path = Path(config_path)
+    content = config_path.read_bytes()
+    if not use_cache:
+        return parse_yaml(content)
+
+    key = cache_key(content)
+    paths = cache_paths(config_path)
+    for path in paths:
+        config = read_cache(path, key)
+        if config is not None:
+            log.debug(f"loaded rules from config cache {path}")
+            return config
+
+    config = parse_yaml(content)
+    write_cache(paths, key, config)
+    return config
+
+
+def load_rules(
+    config_path: Path, use_cache: bool = True, profile: str | None = None
+) -> list[Rule | PatternRule]:
+    """reads the rules that are active with the profile from a connection file,
+    see load_config"""
+    return load_config(config_path, use_cache).profile_rules(profile)
+
+
+class SharedRules:
+    """compiled rule indexes shared by the connection managers of several jack servers.
+    managers using the same connection file get the same index instead of one copy each,
+    also after reloading it. the indexes are read-only, so threads can share them."""
+
+    def __init__(self) -> None:
+        self.indexes: dict[tuple[Path, str | None], RuleIndex] = {}
+        self.lock = Lock()
+
+    def index(
+        self,
+        config_path: Path,
+        rules: list[Rule | PatternRule],
+        profile: str | None = None,
+    ) -> RuleIndex:
+        """returns the index of the rules of a profile loaded from config_path,
+        reusing the index of another manager if it loaded the same rules"""
+        key = (Path(config_path).resolve(), profile)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None or index.rules != rules:
+                index = self.indexes[key] = RuleIndex(rules)
+            return index
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from jack_connection_manager.config import ProfileError
+from jack_connection_manager.edges import EdgeState
+
+if TYPE_CHECKING:
+    from jack_connection_manager.ConnectionManager import ConnectionManager
+
+log = logging.getLogger()
+
+
+class ControlError(Exception):
+    pass
+
+
+def bind_unix_socket(path: Path) -> socket.socket:
+    """binds a listening unix socket, replacing a stale socket file of a stopped process"""
+    if path.exists():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(os.fspath(path))
+            except ConnectionRefusedError:
+                path.unlink()
+            else:
+                raise ControlError(f"{path} is used by another process")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # only the user running the connection manager may control it
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(os.fspath(path))
+        finally:
+            os.umask(old_umask)
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class ControlServer:
+    """line-delimited json api on a unix socket, served on the loop of the connection manager.
+
+    every request is a json object with a "command" and its arguments,
+    every response a json object with "ok" and the result or an "error".
+    all answers come from the state of the connection manager, only resync,
+    profile switches and the ad-hoc connect and disconnect commands call jack.
+    """
+
+    def __init__(self, cm: "ConnectionManager", path: Path) -> None:
+        self.cm = cm
+        self.path = Path(path)
+        self.socket = bind_unix_socket(self.path)
+        self.server: asyncio.Server | None = None
+        self.server_task = cm.loop.create_task(self.serve())
+        self.commands = {
+            "status": self.status,
+            "missing": self.missing,
+            "resync": self.resync,
+            "reload": self.reload,
+            "connect": self.connect,
+            "disconnect": self.disconnect,
+            "profile": self.profile,
+        }
+        log.info(f"listening for control commands on {self.path}")
+
+    async def serve(self):
+        self.server = await asyncio.start_unix_server(self.handle, sock=self.socket)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                response = self.respond(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError is raised for lines over the stream limit
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ControlError("request has to be a json object")
+            command = self.commands.get(request.get("command"))
+            if command is None:
+                raise ControlError(
+                    f"unknown command {request.get('command')!r}, "
+                    f"known commands: {', '.join(self.commands)}"
+                )
+            return {"ok": True, **command(request)}
+        except json.JSONDecodeError as e:
+            return {"ok": False, "error": f"invalid json: {e}"}
+        except (ControlError, ProfileError, self.cm.jack.JackError) as e:
+            return {"ok": False, "error": str(e)}
+
+    def require_server(self):
+        if self.cm.server_lost.is_set():
+            raise ControlError("the jack server is not running")
+
+    def ports(self, request: dict) -> tuple[str, str]:
+        try:
+            return str(request["output"]), str(request["input"])
+        except KeyError as e:
+            raise ControlError(f"missing argument {e}") from None
+
+    def status(self, request: dict) -> dict:
+        cm = self.cm
+        counts = cm.edges.counts
+        return {
+            "edges": {state.value: counts[state] for state in EdgeState},
+            "queued": cm.queue.qsize(),
+            "retrying": len(cm.retries.pending),
+            "converged": cm.is_converged(),
+            "server_running": not cm.server_lost.is_set(),
+            "rules": len(cm.rules.rules),
+            "profile": cm.profile,
+            "priority_converge_seconds": {
+                str(p): t for p, t in cm.queue.converge_times.items()
+            },
+            "reconnects": cm.reconnect_stats["reconnects"],
+            "strict": cm.strict_stats if cm.strict else None,
+        }
+
+    def missing(self, request: dict) -> dict:
+        edges = self.cm.edges
+        with edges.lock:
+            missing = [
+                (edge, state)
+                for edge, state in edges.states.items()
+                if state != EdgeState.CONNECTED
+            ]
+        return {
+            "missing": [
+                {"output": out_port, "input": in_port, "state": state.value}
+                for (out_port, in_port), state in sorted(missing)
+            ]
+        }
+
+    def resync(self, request: dict) -> dict:
+        self.require_server()
+        return {"queued": self.cm.resync()}
+
+    def reload(self, request: dict) -> dict:
+        self.cm.reload()
+        return {"rules": len(self.cm.rules.rules)}
+
+    def connect(self, request: dict) -> dict:
+        self.require_server()
+        self.cm.c.connect(*self.ports(request))
+        return {}
+
+    def disconnect(self, request: dict) -> dict:
+        self.require_server()
+        self.cm.c.disconnect(*self.ports(request))
+        return {}
+
+    def profile(self, request: dict) -> dict:
+        """switches to the profile given as name, without a name it only
+        returns the active and the available profiles"""
+        cm = self.cm
+        result = {}
+        if request.get("name") is not None:
+            result = cm.switch_profile(str(request["name"]))
+        return {
+            **result,
+            "profile": cm.profile,
+            "profiles": [p for p in cm.profile_indexes if p is not None],
+        }
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+        else:
+            self.server_task.cancel()
+            self.socket.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,104 @@
+"""command line client for the control socket of a running connection manager.
+
+usage:
+    jack-connection-manager-ctl status
+    jack-connection-manager-ctl missing
+    jack-connection-manager-ctl resync
+    jack-connection-manager-ctl reload
+    jack-connection-manager-ctl connect system:capture_1 system:playback_1
+    jack-connection-manager-ctl disconnect system:capture_1 system:playback_1
+    jack-connection-manager-ctl profile venue_b
+    jack-connection-manager-ctl --server studio status
+
+only imports the standard library modules it needs, so it starts quickly.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+
+def default_socket_path(servername: str | None = None) -> Path:
+    """the socket of the default jack server, or of the named server
+    if the connection manager manages several servers"""
+    name = "jack-connection-manager"
+    if servername is not None:
+        name = f"{name}@{servername}"
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / f"{name}.sock"
+    return Path(f"/tmp/{name}-{os.getuid()}.sock")
+
+
+def request(command: str, socket_path: Path | None = None, **args) -> dict:
+    """sends a single request to the control socket and returns the response"""
+    if socket_path is None:
+        socket_path = default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(os.fspath(socket_path))
+        s.sendall(json.dumps({"command": command, **args}).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            data = s.recv(65536)
+            if not data:
+                break
+            response += data
+    return json.loads(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="control a running jack-connection-manager"
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        type=Path,
+        default=None,
+        help=f"path of the control socket (default: {default_socket_path()})",
+    )
+    parser.add_argument(
+        "--server",
+        default=None,
+        help="name of the jack server, if the connection manager manages several servers",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="state of the wanted connections")
+    commands.add_parser("missing", help="wanted connections that are not established")
+    commands.add_parser(
+        "resync", help="read the graph again and queue missing connections"
+    )
+    commands.add_parser("reload", help="reload the connection file")
+    for command in ("connect", "disconnect"):
+        ports = commands.add_parser(command, help=f"{command} two ports once")
+        ports.add_argument("output")
+        ports.add_argument("input")
+    profile = commands.add_parser(
+        "profile", help="switch to a profile, without a name list the profiles"
+    )
+    profile.add_argument("name", nargs="?")
+    args = parser.parse_args()
+
+    arguments = {}
+    if args.command in ("connect", "disconnect"):
+        arguments = {"output": args.output, "input": args.input}
+    elif args.command == "profile":
+        arguments = {"name": args.name}
+    socket_path = args.socket
+    if socket_path is None:
+        socket_path = default_socket_path(args.server)
+    try:
+        response = request(args.command, socket_path, **arguments)
+    except OSError as e:
+        print(f"could not reach the connection manager: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    print(json.dumps(response, indent=2))
+    sys.exit(0 if response.get("ok") else 1)
+
+
+if __name__ == "__main__":
+    main()
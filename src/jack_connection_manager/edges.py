@@ -0,0 +1,97 @@
+import sys
+from collections import Counter
+from collections.abc import Iterable
+from enum import Enum
+from threading import Lock
+
+
+class EdgeState(Enum):
+    # wanted and both ports exist, but neither connected nor queued
+    DESIRED = "desired"
+    # queued for connecting or waiting for a retry
+    PENDING = "pending"
+    CONNECTED = "connected"
+    # the retry budget was used up
+    FAILED = "failed"
+
+
+class EdgeTable:
+    """state of all wanted connections between existing ports,
+    keyed by interned (output, input) port names"""
+
+    def __init__(self) -> None:
+        self.states: dict[tuple[str, str], EdgeState] = {}
+        self.by_port: dict[str, set[tuple[str, str]]] = {}
+        # number of edges in each state, kept up to date for cheap convergence checks
+        self.counts: Counter[EdgeState] = Counter()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def get(self, edge: tuple[str, str]) -> EdgeState | None:
+        return self.states.get(edge)
+
+    def _set(self, edge: tuple[str, str], state: EdgeState):
+        old_state = self.states.get(edge)
+        if old_state is not None:
+            self.counts[old_state] -= 1
+        self.states[edge] = state
+        self.counts[state] += 1
+
+    def set(self, edge: tuple[str, str], state: EdgeState):
+        with self.lock:
+            if edge not in self.states:
+                out_port, in_port = edge = (sys.intern(edge[0]), sys.intern(edge[1]))
+                self.by_port.setdefault(out_port, set()).add(edge)
+                self.by_port.setdefault(in_port, set()).add(edge)
+            self._set(edge, state)
+
+    def update(
+        self, edge: tuple[str, str], state: EdgeState, expected: EdgeState | None = None
+    ) -> bool:
+        """sets the state of an edge that is already in the table and,
+        if given, currently in the expected state. returns False otherwise."""
+        with self.lock:
+            current = self.states.get(edge)
+            if current is None or (expected is not None and current != expected):
+                return False
+            self._set(edge, state)
+            return True
+
+    def remove(self, edge: tuple[str, str]):
+        with self.lock:
+            state = self.states.pop(edge, None)
+            if state is None:
+                return
+            self.counts[state] -= 1
+            for port in edge:
+                edges = self.by_port[port]
+                edges.discard(edge)
+                if not edges:
+                    del self.by_port[port]
+
+    def remove_port(self, port: str) -> list[tuple[str, str]]:
+        """removes all edges of a port that went away and returns them,
+        they are added again from the rules when the port is registered again"""
+        with self.lock:
+            edges = self.by_port.pop(port, ())
+            for edge in edges:
+                self.counts[self.states.pop(edge)] -= 1
+                peer = edge[1] if edge[0] == port else edge[0]
+                peer_edges = self.by_port[peer]
+                peer_edges.discard(edge)
+                if not peer_edges:
+                    del self.by_port[peer]
+            return list(edges)
+
+    def edges_in(self, states: Iterable[EdgeState]) -> list[tuple[str, str]]:
+        states = set(states)
+        with self.lock:
+            return [edge for edge, state in self.states.items() if state in states]
+
+    def converged(self) -> bool:
+        """True if no edge between existing ports is waiting to be connected"""
+        return (
+            self.counts[EdgeState.DESIRED] == 0 and self.counts[EdgeState.PENDING] == 0
+        )
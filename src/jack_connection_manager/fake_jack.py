@@ -0,0 +1,347 @@
+"""in-process simulation of a jack server for testing and benchmarking without audio hardware.
+
+implements the subset of the jack module used by the connection manager:
+
+    backend = FakeJack(latency=0.0001)
+    server = backend.server()
+    server.add_client("system", n_outputs=64, output_name="capture_")
+    cm = ConnectionManager(config_path, backend=backend)
+"""
+
+import errno
+import queue
+import re
+import time
+from collections import Counter
+from collections.abc import Callable
+from threading import Lock, Thread
+
+
+class JackError(Exception):
+    pass
+
+
+class JackErrorCode(JackError):
+    def __init__(self, message: str, code: int) -> None:
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class JackOpenError(JackError):
+    def __init__(self, name: str, status=None) -> None:
+        super().__init__(f"Error initializing {name!r}: {status}")
+        self.name = name
+        self.status = status
+
+
+class Port:
+    def __init__(self, name: str, is_output: bool, is_audio: bool = True) -> None:
+        self.name = name
+        self.is_output = is_output
+        self.is_input = not is_output
+        self.is_audio = is_audio
+        self.is_midi = not is_audio
+
+    @property
+    def shortname(self) -> str:
+        return self.name.split(":", 1)[1]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Port) and other.name == self.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+    def __repr__(self) -> str:
+        return f"fake_jack.Port({self.name!r})"
+
+
+def port_name(port: "Port | str") -> str:
+    return port.name if isinstance(port, Port) else port
+
+
+class FakeServer:
+    """graph of a simulated jack server.
+
+    callbacks of active clients are called in order from a separate notification
+    thread, like a real server does. flush() waits until all of them ran.
+    every client call sleeps for latency seconds and is counted in calls.
+    """
+
+    def __init__(self, name: str | None = None, latency: float = 0) -> None:
+        self.name = name
+        self.latency = latency
+        self.running = True
+        self.ports: dict[str, Port] = {}
+        # (output, input) port names
+        self.connections: set[tuple[str, str]] = set()
+        # port name -> names of the ports it is connected to
+        self.peers: dict[str, set[str]] = {}
+        self.clients: list["Client"] = []
+        self.calls: Counter[str] = Counter()
+        # error codes returned by the next connect calls
+        self.connect_errors: list[int] = []
+        self.lock = Lock()
+        self.notifications: queue.Queue[tuple[Callable, tuple]] = queue.Queue()
+        Thread(target=self.notification_loop, daemon=True).start()
+
+    def notification_loop(self):
+        while True:
+            callback, args = self.notifications.get()
+            try:
+                callback(*args)
+            finally:
+                self.notifications.task_done()
+
+    def notify(self, kind: str, *args):
+        for client in self.clients:
+            callback = client.callbacks.get(kind)
+            if client.active and callback is not None:
+                self.notifications.put((callback, args))
+
+    def flush(self):
+        """waits until all pending callbacks were called"""
+        self.notifications.join()
+
+    def call(self, method: str):
+        if not self.running:
+            raise JackError("jack server is not running")
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_port(self, name: str, is_output: bool, is_audio: bool = True) -> Port:
+        with self.lock:
+            if name in self.ports:
+                raise JackError(f"port {name!r} already exists")
+            port = self.ports[name] = Port(name, is_output, is_audio)
+        self.notify("port_registration", port, True)
+        return port
+
+    def remove_port(self, name: str, available: bool = True):
+        """with available False, the callbacks get None instead of the port, like
+        from jack-client when the port is gone by the time it is looked up"""
+        with self.lock:
+            port = self.ports.pop(name)
+            removed = [
+                (name, peer) if port.is_output else (peer, name)
+                for peer in self.peers.pop(name, ())
+            ]
+            for out_port, in_port in removed:
+                self.connections.discard((out_port, in_port))
+                self.peers[in_port if port.is_output else out_port].discard(name)
+        notified = port if available else None
+        for out_port, in_port in removed:
+            self.notify(
+                "port_connect",
+                self.ports.get(out_port, notified),
+                self.ports.get(in_port, notified),
+                False,
+            )
+        self.notify("port_registration", notified, False)
+
+    def add_client(
+        self,
+        name: str,
+        n_inputs: int = 0,
+        n_outputs: int = 0,
+        input_name: str = "input_",
+        output_name: str = "output_",
+        start_index: int = 1,
+    ):
+        """registers the ports of a client with numbered port names"""
+        self.notify("client_registration", name, True)
+        for i in range(n_inputs):
+            self.add_port(f"{name}:{input_name}{start_index + i}", False)
+        for i in range(n_outputs):
+            self.add_port(f"{name}:{output_name}{start_index + i}", True)
+
+    def rename_port(self, name: str, new_name: str):
+        """renames a port, its connections are kept"""
+        with self.lock:
+            port = self.ports.pop(name)
+            port.name = new_name
+            self.ports[new_name] = port
+            peers = self.peers.pop(name, set())
+            self.peers[new_name] = peers
+            for peer in peers:
+                self.peers[peer].discard(name)
+                self.peers[peer].add(new_name)
+                if port.is_output:
+                    self.connections.discard((name, peer))
+                    self.connections.add((new_name, peer))
+                else:
+                    self.connections.discard((peer, name))
+                    self.connections.add((peer, new_name))
+        self.notify("port_rename", port, name, new_name)
+
+    def remove_client(self, name: str):
+        for port in [p for p in self.ports if p.startswith(f"{name}:")]:
+            self.remove_port(port)
+        self.notify("client_registration", name, False)
+
+    def connect(self, source: str, destination: str):
+        with self.lock:
+            if self.connect_errors:
+                code = self.connect_errors.pop(0)
+                raise JackErrorCode(
+                    f"Error connecting {source!r} -> {destination!r}", code
+                )
+            if source not in self.ports or destination not in self.ports:
+                raise JackErrorCode(
+                    f"Error connecting {source!r} -> {destination!r}", -1
+                )
+            if (source, destination) in self.connections:
+                raise JackErrorCode(
+                    f"Connection {source!r} -> {destination!r} already exists",
+                    errno.EEXIST,
+                )
+            self.connections.add((source, destination))
+            self.peers.setdefault(source, set()).add(destination)
+            self.peers.setdefault(destination, set()).add(source)
+            ports = self.ports[source], self.ports[destination]
+        self.notify("port_connect", *ports, True)
+
+    def disconnect(self, source: str, destination: str):
+        with self.lock:
+            if (source, destination) not in self.connections:
+                raise JackErrorCode(
+                    f"Error disconnecting {source!r} -> {destination!r}", -1
+                )
+            self.connections.remove((source, destination))
+            self.peers[source].discard(destination)
+            self.peers[destination].discard(source)
+            ports = self.ports[source], self.ports[destination]
+        self.notify("port_connect", *ports, False)
+
+    def shutdown(self):
+        """stops the server, active clients get their shutdown callback"""
+        with self.lock:
+            self.running = False
+            self.ports.clear()
+            self.connections.clear()
+            self.peers.clear()
+            clients, self.clients = self.clients, []
+        for client in clients:
+            callback = client.callbacks.get("shutdown")
+            if client.active and callback is not None:
+                self.notifications.put((callback, (None, "server shut down")))
+        self.flush()
+
+    def start(self):
+        self.running = True
+
+
+class Client:
+    def __init__(self, server: FakeServer, name: str) -> None:
+        self.server = server
+        self.name = name
+        self.active = False
+        self.callbacks: dict[str, Callable] = {}
+
+    def activate(self):
+        self.server.call("activate")
+        self.active = True
+
+    def deactivate(self, ignore_errors=True):
+        self.active = False
+
+    def close(self, ignore_errors=True):
+        self.active = False
+        if self in self.server.clients:
+            self.server.clients.remove(self)
+
+    def get_ports(
+        self,
+        name_pattern="",
+        is_audio=False,
+        is_midi=False,
+        is_input=False,
+        is_output=False,
+        is_physical=False,
+        is_terminal=False,
+    ) -> list[Port]:
+        self.server.call("get_ports")
+        pattern = re.compile(name_pattern)
+        with self.server.lock:
+            return [
+                port
+                for port in self.server.ports.values()
+                if pattern.search(port.name)
+                and (not is_audio or port.is_audio)
+                and (not is_midi or port.is_midi)
+                and (not is_input or port.is_input)
+                and (not is_output or port.is_output)
+            ]
+
+    def get_port_by_name(self, name: str) -> Port:
+        self.server.call("get_port_by_name")
+        try:
+            return self.server.ports[name]
+        except KeyError:
+            raise JackError(f"Port {name!r} not available") from None
+
+    def get_all_connections(self, port: Port | str) -> list[Port]:
+        self.server.call("get_all_connections")
+        name = port_name(port)
+        with self.server.lock:
+            if name not in self.server.ports:
+                raise JackError(f"Port {name!r} not available")
+            return [self.server.ports[peer] for peer in self.server.peers.get(name, ())]
+
+    def connect(self, source: Port | str, destination: Port | str):
+        self.server.call("connect")
+        self.server.connect(port_name(source), port_name(destination))
+
+    def disconnect(self, source: Port | str, destination: Port | str):
+        self.server.call("disconnect")
+        self.server.disconnect(port_name(source), port_name(destination))
+
+    def set_port_registration_callback(self, callback=None, only_available=True):
+        self.callbacks["port_registration"] = callback
+
+    def set_port_connect_callback(self, callback=None, only_available=True):
+        self.callbacks["port_connect"] = callback
+
+    def set_port_rename_callback(self, callback=None, only_available=True):
+        self.callbacks["port_rename"] = callback
+
+    def set_client_registration_callback(self, callback=None, only_available=True):
+        self.callbacks["client_registration"] = callback
+
+    def set_shutdown_callback(self, callback):
+        self.callbacks["shutdown"] = callback
+
+
+class FakeJack:
+    """drop-in replacement for the jack module, holding any number of named servers"""
+
+    JackError = JackError
+    JackErrorCode = JackErrorCode
+    JackOpenError = JackOpenError
+    Port = Port
+
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+        self.servers: dict[str | None, FakeServer] = {}
+
+    def server(self, name: str | None = None) -> FakeServer:
+        """returns the server with the name, starting it if needed"""
+        if name not in self.servers:
+            self.servers[name] = FakeServer(name, self.latency)
+        return self.servers[name]
+
+    def Client(
+        self, name: str, no_start_server=False, servername=None, **kwargs
+    ) -> Client:
+        server = self.servers.get(servername)
+        if server is None or not server.running:
+            if no_start_server:
+                raise JackOpenError(name)
+            server = self.server(servername)
+            server.start()
+        server.call("client_open")
+        client = Client(server, name)
+        server.clients.append(client)
+        return client
@@ -0,0 +1,132 @@
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    import jack
+
+
+class GraphSnapshot:
+    """ports and connections of the jack graph, read in a single pass"""
+
+    def __init__(self, client: "jack.Client", port_names: Iterable[str] | None = None):
+        """reads all ports of the graph and the connections of their outputs.
+        if port_names is given, connections are only queried for those ports."""
+        self.ports: dict[str, "jack.Port"] = {p.name: p for p in client.get_ports()}
+        # connections are stored as (output, input) name tuples
+        self.connections: set[tuple[str, str]] = set()
+
+        if port_names is None:
+            queried = [p for p in self.ports.values() if p.is_output]
+        else:
+            queried = [self.ports[name] for name in port_names if name in self.ports]
+
+        for port in queried:
+            for connected_port in client.get_all_connections(port):
+                if port.is_output:
+                    self.connections.add((port.name, connected_port.name))
+                else:
+                    self.connections.add((connected_port.name, port.name))
+
+    def directed_edge(self, a: str, b: str) -> tuple[str, str] | None:
+        """returns the (output, input) tuple for two port names,
+        or None if one of the ports doesn't exist"""
+        port_a = self.ports.get(a)
+        if port_a is None or b not in self.ports:
+            return None
+        return (a, b) if port_a.is_output else (b, a)
+
+    def directed_edges(self, edges: Iterable[tuple[str, str]]):
+        """yields (output, input), connected tuples for all edges between existing ports"""
+        for a, b in edges:
+            edge = self.directed_edge(a, b)
+            if edge is not None:
+                yield edge, edge in self.connections
+
+
+class PortFlags(NamedTuple):
+    is_output: bool
+    is_audio: bool
+
+
+# all ports of a mirror share these, instead of keeping a flags object per port
+port_flags = {
+    (is_output, is_audio): PortFlags(is_output, is_audio)
+    for is_output in (False, True)
+    for is_audio in (False, True)
+}
+
+
+class GraphMirror(GraphSnapshot):
+    """ports and connections of the jack graph, seeded from a single snapshot and
+    then kept up to date from the notifications of the client instead of asking
+    jack again. ports are stored as PortFlags, so lookups don't call jack.
+    it isn't locked, so it has to be used from a single thread."""
+
+    def __init__(self, client: "jack.Client"):
+        super().__init__(client)
+        self.ports = {
+            name: port_flags[port.is_output, port.is_audio]
+            for name, port in self.ports.items()
+        }
+        # port name -> names of the ports it is connected to. tuples instead of sets,
+        # the garbage collector stops tracking them, which matters for large graphs
+        self.peers: dict[str, tuple[str, ...]] = {}
+        for out_port, in_port in self.connections:
+            self.link(out_port, in_port)
+
+    def link(self, a: str, b: str):
+        peers = self.peers
+        peers[a] = peers.get(a, ()) + (b,)
+        peers[b] = peers.get(b, ()) + (a,)
+
+    def unlink(self, a: str, b: str):
+        peers = self.peers
+        for port, peer in ((a, b), (b, a)):
+            if peer in peers.get(port, ()):
+                peers[port] = tuple(p for p in peers[port] if p != peer)
+
+    def add_port(self, name: str, is_output: bool, is_audio: bool):
+        self.ports[name] = port_flags[is_output, is_audio]
+
+    def remove_port(self, name: str):
+        self.ports.pop(name, None)
+        for peer in self.peers.get(name, ()):
+            self.disconnect(name, peer)
+            self.disconnect(peer, name)
+        self.peers.pop(name, None)
+
+    def rename_port(self, old_name: str, new_name: str):
+        """jack keeps the connections of renamed ports"""
+        flags = self.ports.pop(old_name, None)
+        if flags is None:
+            return
+        self.ports[new_name] = flags
+        for peer in self.peers.get(old_name, ()):
+            if flags.is_output:
+                self.disconnect(old_name, peer)
+                self.connect(new_name, peer)
+            else:
+                self.disconnect(peer, old_name)
+                self.connect(peer, new_name)
+        self.peers.pop(old_name, None)
+
+    def remove_client(self, client_name: str):
+        for name in [p for p in self.ports if p.startswith(f"{client_name}:")]:
+            self.remove_port(name)
+
+    def connect(self, out_port: str, in_port: str):
+        if (out_port, in_port) not in self.connections:
+            self.connections.add((out_port, in_port))
+            self.link(out_port, in_port)
+
+    def disconnect(self, out_port: str, in_port: str):
+        if (out_port, in_port) in self.connections:
+            self.connections.remove((out_port, in_port))
+            self.unlink(out_port, in_port)
+
+    def drift(self, snapshot: GraphSnapshot) -> tuple[int, int]:
+        """returns the number of ports and connections that differ from a snapshot"""
+        return (
+            len(self.ports.keys() ^ snapshot.ports.keys()),
+            len(self.connections ^ snapshot.connections),
+        )
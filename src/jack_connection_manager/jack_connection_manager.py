@@ -1,16 +1,23 @@
-import jack
 import click
 import logging
+import os
 from pathlib import Path
 import sys
 import signal
+from typing import TYPE_CHECKING
 
-from sdnotify import SystemdNotifier
-from jack_connection_manager.ConnectionManager import ConnectionManager
+from jack_connection_manager.check import formats
+from jack_connection_manager.control_client import default_socket_path
+
+# the modules for running the connection manager (asyncio, jack, yaml, sdnotify)
+# are only imported by the code paths that need them, so --help, --version and
+# -l start quickly, see benchmarks/bench_import.py
+if TYPE_CHECKING:
+    from jack_connection_manager.ConnectionManager import ConnectionManager
+    from jack_connection_manager.servers import ServerGroup
 
 logFormat = "%(asctime)s [%(levelname)-5.5s]: %(message)s"
 timeFormat = "%Y-%m-%d %H:%M:%S"
-logging.basicConfig(format=logFormat, datefmt=timeFormat)
 log = logging.getLogger()
 
 
@@ -33,6 +40,47 @@ default_config_file_locations = [
 ]
 
 
+def parse_servers(
+    server_specs: tuple[str, ...], config_path: Path | None
+) -> dict[str | None, Path | None]:
+    """maps the server names of --server to their connection files,
+    the default server is None"""
+    if not server_specs:
+        return {None: config_path}
+    servers = {}
+    for spec in server_specs:
+        name, _, server_config_path = spec.partition("=")
+        if not name:
+            raise click.BadParameter(
+                f"missing server name in {spec!r}", param_hint="--server"
+            )
+        if server_config_path:
+            server_config_path = Path(server_config_path).resolve()
+            if not server_config_path.is_file():
+                raise click.BadParameter(
+                    f"connection file {server_config_path} does not exist",
+                    param_hint="--server",
+                )
+        servers[name] = server_config_path or config_path
+    return servers
+
+
+def server_path(path: Path, servername: str | None, n_servers: int) -> Path:
+    """with several servers, paths given on the command line
+    get the server name appended like the default sockets"""
+    if n_servers > 1:
+        return path.with_name(f"{path.stem}@{servername}{path.suffix}")
+    return path
+
+
+def control_socket_path(
+    control_socket: Path | None, servername: str | None, n_servers: int
+) -> Path:
+    if control_socket is None:
+        return default_socket_path(servername)
+    return server_path(control_socket, servername, n_servers)
+
+
 def get_default_config_path():
     for possible_config_path in (
         base / default_config_file_path / filename
@@ -44,22 +92,6 @@ def get_default_config_path():
     return None
 
 
-def remove_connections(exclude: list[str]):
-    c = jack.Client("jack_disconneeect", no_start_server=True)
-    log.info(f"Removing all connections, skipping clients: {', '.join(exclude)}")
-
-    out_ports: list[jack.Port] = c.get_ports(is_audio=True, is_output=True)
-    for p in out_ports:
-        connected_ports = c.get_all_connections(p)
-        if p.name.startswith(exclude):
-            continue
-        for c_p in connected_ports:
-            if c_p.name.startswith(exclude):
-                continue
-
-            c.disconnect(p, c_p)
-
-
 @click.command(
     help="Set Jack Connections",
     context_settings=dict(help_option_names=["-h", "--help"]),
@@ -80,26 +112,170 @@ def remove_connections(exclude: list[str]):
     default=False,
     help="remove all connections except for those specified with -e",
 )
+@click.option(
+    "--enforce",
+    is_flag=True,
+    default=False,
+    help="remove only the connections that are not in the connection file, except for those specified with -e",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="with -r or --enforce, only print the connections that would be removed",
+)
 @click.option(
     "-e",
     "--exclude",
     multiple=True,
     default=[],
-    help="clients that start with the specified string will not be disconnected, can be specified multiple times",
+    help="clients that start with the specified string will not be disconnected by -r, --enforce or --strict, can be specified multiple times",
 )
 @click.option(
     "--client-name", help="Name for the jack client", default="jack_connection_manager"
 )
+@click.option(
+    "--server",
+    "server_specs",
+    multiple=True,
+    metavar="NAME[=CONFIG]",
+    help="name of the jack server to manage instead of the default server, can be specified multiple times to manage several servers from one process, optionally with a connection file per server",
+)
+@click.option(
+    "-p",
+    "--profile",
+    default=None,
+    help="profile of the connection file to use instead of its default profile, SIGUSR1 switches to the next profile",
+)
 @click.option(
     "-l",
     "--list-missing",
-    help="List missing ports and connections",
+    help="List missing ports and connections without changing the graph and exit with 0 if nothing is missing, 1 if ports are missing, 2 if connections between existing ports are missing or 3 if jack isn't running",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(list(formats)),
+    default="text",
+    show_default=True,
+    help="output format of -l",
+)
+@click.option(
+    "--coalesce-window",
+    type=click.FloatRange(min=0),
+    default=10,
+    show_default=True,
+    help="time in ms to wait for further port registrations before reconciling, 0 disables coalescing",
+)
+@click.option(
+    "--coalesce-max-latency",
+    type=click.FloatRange(min=0),
+    default=100,
+    show_default=True,
+    help="maximum time in ms a port registration is delayed by coalescing",
+)
+@click.option(
+    "--no-config-cache",
+    "no_config_cache",
+    is_flag=True,
+    default=False,
+    help="always parse the connection file instead of using the cached rules",
+)
+@click.option(
+    "--no-watch",
+    "no_watch",
     is_flag=True,
     default=False,
+    help="don't reload the connection file when it changes, SIGHUP still reloads it",
+)
+@click.option(
+    "--prune-on-reload",
+    is_flag=True,
+    default=False,
+    help="on reload, remove connections made by this client that are no longer in the connection file",
+)
+@click.option(
+    "--metrics-port",
+    type=click.IntRange(0, 65535),
+    default=None,
+    help="serve prometheus metrics over http on this port",
+)
+@click.option(
+    "--metrics-address",
+    default="127.0.0.1",
+    show_default=True,
+    help="address the metrics endpoint listens on",
+)
+@click.option(
+    "--metrics-textfile",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="write prometheus metrics to this file for the textfile collector of the node exporter",
+)
+@click.option(
+    "--strict",
+    is_flag=True,
+    default=False,
+    help="keep the graph exactly as in the connection file: remove other connections and restore removed ones, except for those specified with -e",
+)
+@click.option(
+    "--control-socket",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=f"unix socket for controlling the running connection manager with jack-connection-manager-ctl [default: {default_socket_path()}, {default_socket_path('NAME').name} for --server NAME]",
+)
+@click.option(
+    "--no-control-socket",
+    is_flag=True,
+    default=False,
+    help="don't listen on the control socket",
+)
+@click.option(
+    "--trace",
+    "trace_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="write the lifecycle of every connection (port registered, queued, connect attempts with their jack error codes, confirmed) as a chrome trace to this file after every convergence, for ui.perfetto.dev or chrome://tracing",
+)
+@click.option(
+    "--ready-timeout",
+    type=click.FloatRange(min=0),
+    default=30,
+    show_default=True,
+    help="time in s after which readiness is reported to systemd even if the initial sync didn't converge, 0 reports it right away",
 )
 @click.option("-v", "--verbose", count=True, help="increase verbosity level.")
 @click.version_option()
-def main(config_path, disconnect, exclude, client_name, list_missing, verbose):
+def main(
+    config_path,
+    disconnect,
+    enforce,
+    dry_run,
+    exclude,
+    client_name,
+    server_specs,
+    profile,
+    list_missing,
+    output_format,
+    coalesce_window,
+    coalesce_max_latency,
+    no_config_cache,
+    no_watch,
+    prune_on_reload,
+    metrics_port,
+    metrics_address,
+    metrics_textfile,
+    strict,
+    control_socket,
+    no_control_socket,
+    trace_path,
+    ready_timeout,
+    verbose,
+):
+    logging.basicConfig(format=logFormat, datefmt=timeFormat)
     if list_missing:
         log.setLevel(logging.WARN)
     elif verbose == 0:
@@ -107,9 +283,21 @@ def main(config_path, disconnect, exclude, client_name, list_missing, verbose):
     elif verbose >= 1:
         log.setLevel(logging.DEBUG)
 
+    if disconnect and enforce:
+        raise click.UsageError("-r and --enforce can't be combined")
+    if dry_run and not (disconnect or enforce):
+        raise click.UsageError("-n/--dry-run needs -r or --enforce")
+
+    if len(server_specs) > 1 and (disconnect or enforce or list_missing):
+        log.error("-r, --enforce and -l work on a single server")
+        sys.exit(-1)
+    servername = server_specs[0].partition("=")[0] if server_specs else None
+
     # do the disconnect!
     if disconnect:
-        remove_connections(exclude)
+        from jack_connection_manager.remove import remove_connections
+
+        remove_connections(exclude, dry_run=dry_run, servername=servername)
         log.info("exiting...")
         sys.exit(0)
 
@@ -118,22 +306,159 @@ def main(config_path, disconnect, exclude, client_name, list_missing, verbose):
         # check different paths for a config file, with the highest one taking precedence
         config_path = get_default_config_path()
 
-    if config_path is None:
+    servers = parse_servers(server_specs, config_path)
+    if None in servers.values():
         log.error("could not find connection file, please supply one using -c")
         sys.exit(-1)
+    config_path = next(iter(servers.values()))
 
-    cm = ConnectionManager(config_path, client_name)
     if list_missing:
-        cm.print_missing_connections()
+        from jack_connection_manager.check import run_check
+
+        sys.exit(
+            run_check(
+                config_path,
+                client_name,
+                output_format,
+                not no_config_cache,
+                servername=servername,
+                profile=profile,
+            )
+        )
+
+    if enforce:
+        from jack_connection_manager.config import load_rules
+        from jack_connection_manager.remove import remove_connections
+        from jack_connection_manager.rules import RuleIndex
+
+        try:
+            rules = RuleIndex(load_rules(config_path, not no_config_cache, profile))
+        except (OSError, ValueError) as e:
+            log.error(f"could not read {config_path}: {e}")
+            sys.exit(-1)
+        remove_connections(exclude, rules=rules, dry_run=dry_run, servername=servername)
+        log.info("exiting...")
         sys.exit(0)
-    systemd = SystemdNotifier()
+
+    from jack_connection_manager.ConnectionManager import ConnectionManager
+    from jack_connection_manager.config import ProfileError
+    from jack_connection_manager.control import ControlError, ControlServer
+    from jack_connection_manager.servers import ServerGroup
+
+    manager_options = dict(
+        clientname=client_name,
+        coalesce_window=coalesce_window / 1000,
+        coalesce_max_latency=coalesce_max_latency / 1000,
+        use_config_cache=not no_config_cache,
+        watch_config=not no_watch,
+        prune_on_reload=prune_on_reload,
+        strict=strict,
+        exclude=exclude,
+        profile=profile,
+    )
+
+    def add_control_server(cm: ConnectionManager):
+        if no_control_socket:
+            return
+        path = control_socket_path(control_socket, cm.servername, len(servers))
+        try:
+            cm.services.append(ControlServer(cm, path))
+        except (ControlError, OSError) as e:
+            log.error(f"could not listen on {path}: {e}")
+
+    if len(servers) > 1:
+        # each server logs from its own thread, named after the server
+        for handler in log.handlers:
+            handler.setFormatter(
+                logging.Formatter(
+                    "%(asctime)s [%(levelname)-5.5s] %(threadName)s: %(message)s",
+                    timeFormat,
+                )
+            )
+        server_options = {}
+        if trace_path is not None:
+            server_options = {
+                name: {"trace_path": server_path(trace_path, name, len(servers))}
+                for name in servers
+            }
+        group = ServerGroup(
+            servers, add_control_server, server_options, **manager_options
+        )
+        run(
+            group,
+            group.reload,
+            group.next_profile,
+            metrics_address,
+            metrics_port,
+            metrics_textfile,
+            ready_timeout,
+        )
+        if group.failed == servers.keys():
+            sys.exit(-2)
+        return
+
+    try:
+        cm = ConnectionManager(
+            config_path,
+            servername=servername,
+            trace_path=trace_path,
+            **manager_options,
+        )
+    except ProfileError as e:
+        log.error(str(e))
+        sys.exit(-1)
+    add_control_server(cm)
+    run(
+        cm,
+        cm.watcher.changed,
+        cm.next_profile,
+        metrics_address,
+        metrics_port,
+        metrics_textfile,
+        ready_timeout,
+    )
+
+
+def run(
+    manager: "ConnectionManager | ServerGroup",
+    reload,
+    next_profile,
+    metrics_address: str,
+    metrics_port: int | None,
+    metrics_textfile: Path | None,
+    ready_timeout: float,
+):
+    """runs the loop of a connection manager or a group of them until a signal stops it.
+    readiness is reported to systemd once the initial sync converged or after
+    ready_timeout, if systemd runs it with a notify socket
+    """
+    from jack_connection_manager.metrics import MetricsExporter
+
+    if metrics_port is not None or metrics_textfile is not None:
+        manager.services.append(
+            MetricsExporter(
+                manager.loop,
+                manager.render_metrics,
+                metrics_address,
+                metrics_port,
+                metrics_textfile,
+            )
+        )
 
     log.info("jack-connection-manager is running")
     for sig in [signal.SIGINT, signal.SIGTERM]:
-        signal.signal(sig, cm.deactivate)
-    systemd.notify("READY=1")
-    # start the connection loop
-    cm.connection_loop()
+        manager.loop.add_signal_handler(sig, manager.deactivate)
+    manager.loop.add_signal_handler(signal.SIGHUP, reload)
+    manager.loop.add_signal_handler(signal.SIGUSR1, next_profile)
+    if os.environ.get("NOTIFY_SOCKET"):
+        from sdnotify import SystemdNotifier
+
+        from jack_connection_manager.systemd import ServiceNotifier
+
+        notify = SystemdNotifier().notify
+        manager.services.append(ServiceNotifier(manager, notify, ready_timeout))
+    # run the event loop until a signal stops it
+    manager.connection_loop()
 
 
 if __name__ == "__main__":
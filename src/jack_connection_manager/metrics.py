@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import socket
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from threading import Lock
+
+log = logging.getLogger()
+
+# upper bounds of the connect latency histogram buckets in seconds
+connect_latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)  # fmt: skip
+
+# interval in seconds for writing the textfile
+textfile_interval = 15
+
+
+def format_labels(names: Iterable[str], values: Iterable, const_labels=()) -> str:
+    """const_labels are (name, value) tuples put before the other labels,
+    e.g. the server of a connection manager"""
+    labels = ",".join(
+        f'{name}="{value}"' for name, value in (*const_labels, *zip(names, values))
+    )
+    return f"{{{labels}}}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+        self.lock = Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, const_labels=()) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(
+                    f"{self.name}{format_labels(self.labelnames, labels, const_labels)} {value}"
+                )
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def render(self, const_labels=()) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        labels = format_labels((), (), const_labels)
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = format_labels(("le",), (le,), const_labels)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {self.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def samples(
+    name: str,
+    kind: str,
+    help: str,
+    values: dict[tuple, float],
+    labelnames=(),
+    const_labels=(),
+) -> list[str]:
+    """renders values that are read when scraping, e.g. gauges"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in values.items():
+        lines.append(f"{name}{format_labels(labelnames, labels, const_labels)} {value}")
+    return lines
+
+
+def merge_expositions(texts: Iterable[str]) -> str:
+    """merges metrics in the text format, e.g. of several connection managers,
+    so the samples of each metric follow a single HELP and TYPE line"""
+    families: dict[str, list[str]] = {}
+    lines: list[str] = []
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                lines = families.get(name)
+                if lines is None:
+                    lines = families[name] = [line]
+            elif not line.startswith("# TYPE ") or len(lines) == 1:
+                lines.append(line)
+    return "".join(line + "\n" for family in families.values() for line in family)
+
+
+class Metrics:
+    """metrics of the connection loop, updated by the connection manager"""
+
+    def __init__(self) -> None:
+        self.connect_latency = Histogram(
+            "jack_connection_manager_connect_duration_seconds",
+            "Duration of jack connect calls.",
+            connect_latency_buckets,
+        )
+        self.retries = Counter(
+            "jack_connection_manager_connect_retries_total",
+            "Failed connects that were scheduled for a retry, by jack error code.",
+            ("code",),
+        )
+        self.failures = Counter(
+            "jack_connection_manager_connect_failures_total",
+            "Connects that failed after using up their retries, by jack error code.",
+            ("code",),
+        )
+
+
+class MetricsExporter:
+    """serves the metrics in the prometheus text format over http and/or
+    writes them to a file for the textfile collector of the node exporter,
+    both on the event loop of the connection manager"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        render: Callable[[], str],
+        address: str = "127.0.0.1",
+        port: int | None = None,
+        textfile: Path | None = None,
+    ) -> None:
+        self.loop = loop
+        self.render = render
+        self.textfile = textfile
+        self.server: asyncio.Server | None = None
+        self.server_task: asyncio.Task | None = None
+        self.textfile_timer: asyncio.TimerHandle | None = None
+
+        if port is not None:
+            # bound right away, so errors show up when starting and port 0 can be resolved
+            self.socket = socket.create_server((address, port))
+            self.port = self.socket.getsockname()[1]
+            self.server_task = loop.create_task(self.serve())
+            log.info(f"serving metrics on http://{address}:{self.port}/")
+
+        if textfile is not None:
+            self.textfile_timer = loop.call_soon(self.textfile_loop)
+
+    async def serve(self):
+        self.server = await asyncio.start_server(self.handle, sock=self.socket)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1].split(b"?")[0]
+            if path in (b"/", b"/metrics"):
+                status = "200 OK"
+                body = self.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError):
+            log.debug("invalid metrics request")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def write_textfile(self):
+        # written to a temporary file first, so the collector never reads half a file
+        tmp_path = self.textfile.with_name(f".{self.textfile.name}.{os.getpid()}")
+        try:
+            tmp_path.write_text(self.render())
+            tmp_path.replace(self.textfile)
+        except OSError as e:
+            log.warning(f"could not write metrics to {self.textfile}: {e}")
+
+    def textfile_loop(self):
+        self.write_textfile()
+        self.textfile_timer = self.loop.call_later(
+            textfile_interval, self.textfile_loop
+        )
+
+    def stop(self):
+        if self.textfile_timer is not None:
+            self.textfile_timer.cancel()
+            self.write_textfile()
+        if self.server is not None:
+            self.server.close()
+        elif self.server_task is not None:
+            self.server_task.cancel()
+            self.socket.close()
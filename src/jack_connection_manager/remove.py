@@ -0,0 +1,88 @@
+import logging
+from typing import TYPE_CHECKING
+
+from jack_connection_manager.rules import RuleIndex
+
+if TYPE_CHECKING:
+    import jack
+
+log = logging.getLogger()
+
+
+def audio_connections(
+    c: "jack.Client", exclude: tuple[str, ...]
+) -> list[tuple[str, str]]:
+    """reads the (output, input) connections of all audio outputs in one pass,
+    outputs of excluded clients aren't queried at all"""
+    return [
+        (out_port.name, in_port.name)
+        for out_port in c.get_ports(is_audio=True, is_output=True)
+        if not out_port.name.startswith(exclude)
+        for in_port in c.get_all_connections(out_port)
+    ]
+
+
+def removal_plan(
+    connections: list[tuple[str, str]],
+    exclude: tuple[str, ...],
+    rules: RuleIndex | None = None,
+) -> list[tuple[str, str]]:
+    """returns the (output, input) connections that should be removed: all except
+    those of excluded clients and, if rules are given, those in the connection file"""
+    plan = connections
+    if exclude:
+        plan = [
+            (out_port, in_port)
+            for out_port, in_port in plan
+            if not (out_port.startswith(exclude) or in_port.startswith(exclude))
+        ]
+    if rules is not None:
+        peers = rules.peers
+        plan = [
+            (out_port, in_port)
+            for out_port, in_port in plan
+            if in_port not in peers(out_port)
+        ]
+    return plan
+
+
+def remove_connections(
+    exclude: tuple[str, ...],
+    backend=None,
+    rules: RuleIndex | None = None,
+    dry_run: bool = False,
+    servername: str | None = None,
+) -> list[tuple[str, str]]:
+    """removes the audio connections of the removal plan, which is made from a single
+    read of the graph before anything is changed. with dry_run they are only printed.
+    returns the planned connections."""
+    if backend is None:
+        import jack as backend
+    exclude = tuple(exclude)
+    c = backend.Client("jack_disconneeect", no_start_server=True, servername=servername)
+    if rules is None:
+        log.info(f"Removing all connections, skipping clients: {', '.join(exclude)}")
+    else:
+        log.info(
+            "Removing connections that are not in the connection file, "
+            f"skipping clients: {', '.join(exclude)}"
+        )
+
+    connections = audio_connections(c, exclude)
+    plan = removal_plan(connections, exclude, rules)
+    n_kept = len(connections) - len(plan)
+
+    if dry_run:
+        for out_port, in_port in sorted(plan):
+            print(f"disconnect {out_port} -> {in_port}")
+        print(f"{len(plan)} connections would be removed, {n_kept} kept")
+    else:
+        for out_port, in_port in plan:
+            try:
+                c.disconnect(out_port, in_port)
+            except backend.JackError as e:
+                # the connection might have been removed since the snapshot
+                log.warning(f"could not disconnect {out_port} -> {in_port}: {e}")
+        log.info(f"removed {len(plan)} connections, kept {n_kept}")
+    c.close()
+    return plan
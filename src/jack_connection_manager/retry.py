@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import random
+from collections.abc import Callable, Hashable
+
+log = logging.getLogger()
+
+
+class RetryScheduler:
+    """delay queue for retrying failed connections.
+
+    every pending retry is a timer of the event loop, so waiting retries
+    need no thread and cause no wakeups until they are due.
+    all methods have to be called from the thread running the loop.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        callback: Callable[[Hashable], None],
+        base_delay: float = 1,
+        backoff: float = 2,
+        max_delay: float = 10,
+        jitter: float = 0.1,
+        budget: int = 15,
+    ) -> None:
+        """callback is called on the loop with the edge once its retry is due.
+        the n-th retry of an edge is delayed by base_delay * backoff**n seconds,
+        capped at max_delay and randomly varied by +-jitter (relative)."""
+        self.loop = loop
+        self.callback = callback
+        self.base_delay = base_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+
+        # timer of the pending retry of each edge
+        self.pending: dict[Hashable, asyncio.TimerHandle] = {}
+        # number of retries already used by each edge
+        self.attempts: dict[Hashable, int] = {}
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * self.backoff**attempt)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def schedule(self, edge: Hashable) -> bool:
+        """schedules a retry for the edge.
+        returns False if the edge has used up its retry budget."""
+        attempt = self.attempts.get(edge, 0)
+        if attempt >= self.budget:
+            self.cancel(edge)
+            return False
+
+        self.attempts[edge] = attempt + 1
+        timer = self.pending.pop(edge, None)
+        if timer is not None:
+            timer.cancel()
+        self.pending[edge] = self.loop.call_later(self.delay(attempt), self.fire, edge)
+        return True
+
+    def fire(self, edge: Hashable):
+        del self.pending[edge]
+        self.callback(edge)
+
+    def cancel(self, edge: Hashable):
+        """cancels the pending retry of the edge and resets its retry budget"""
+        timer = self.pending.pop(edge, None)
+        if timer is not None:
+            timer.cancel()
+        self.attempts.pop(edge, None)
+
+    def cancel_port(self, port_name: str):
+        """cancels all pending retries of (output, input) edges containing the port"""
+        for edge in [e for e in self.attempts if port_name in e]:
+            self.cancel(edge)
+
+    def cancel_all(self):
+        for timer in self.pending.values():
+            timer.cancel()
+        self.pending.clear()
+        self.attempts.clear()
+
+    def stop(self):
+        self.cancel_all()
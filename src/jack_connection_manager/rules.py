@@ -0,0 +1,412 @@
+import re
+from bisect import insort
+from collections.abc import Iterable, Iterator
+from functools import cache
+from typing import NamedTuple
+
+
+class Rule(NamedTuple):
+    """count consecutive channels of a source connected to a sink"""
+
+    source_prefix: str
+    source_start: int
+    count: int
+    sink_prefix: str
+    sink_start: int
+    # connections of rules with a higher priority are made first
+    priority: int = 0
+
+
+class PatternRule(NamedTuple):
+    """ports matching the source pattern connected to the port
+    that the sink pattern gives for the values of the placeholders.
+    the sink pattern can leave out placeholders of the source pattern,
+    e.g. to connect the same channel of several clients to one sink."""
+
+    source: str
+    sink: str
+    priority: int = 0
+
+
+# {name}, {name:regex}, {name+offset} or a * glob
+placeholder = re.compile(r"\{(\w+)([+-]\d+)?(?::([^{}]*))?\}|\*")
+
+
+class Template:
+    """a compiled port name pattern of a PatternRule.
+
+    placeholders match any text, {name:regex} only text matching the regex.
+    {name+N} and {name-N} match a channel number that is N off from the value
+    of the placeholder, e.g. out_{ch+1} and in_{ch} map out_2 to in_1.
+    * globs are numbered by their order and map to the globs of the other side.
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        # literal strings and (placeholder, offset) tuples
+        self.parts: list[str | tuple[str, int | None]] = []
+        regex = []
+        pos = n_globs = 0
+        for m in placeholder.finditer(pattern):
+            literal = pattern[pos : m.start()]
+            pos = m.end()
+            self.parts.append(literal)
+            regex.append(re.escape(literal))
+            if m.group() == "*":
+                name, offset, field = f"_{n_globs}", None, ".*?"
+                n_globs += 1
+            else:
+                name, offset, field = m.groups()
+                if offset is not None:
+                    offset = int(offset)
+                if field is None:
+                    # channel numbers are never written with leading zeros
+                    field = ".+?" if offset is None else r"0|[1-9]\d*"
+            if any(name == part[0] for part in self.parts if isinstance(part, tuple)):
+                raise ValueError(f"placeholder {name} is used twice in {pattern!r}")
+            self.parts.append((name, offset))
+            regex.append(f"(?P<{name}>{field})")
+        self.parts.append(pattern[pos:])
+        regex.append(re.escape(pattern[pos:]))
+        try:
+            self.regex = re.compile("".join(regex))
+        except re.error as e:
+            raise ValueError(f"invalid pattern {pattern!r}: {e}") from None
+        # port names matching the pattern start and end with these, used for indexing
+        self.prefix = self.parts[0]
+        self.suffix = self.parts[-1] if len(self.parts) > 1 else ""
+        self.fields = {part[0] for part in self.parts if isinstance(part, tuple)}
+
+    def match(self, name: str) -> dict[str, str | int] | None:
+        """returns the values of the placeholders if the port name matches,
+        placeholders with an offset as the channel number minus the offset"""
+        m = self.regex.fullmatch(name)
+        if m is None:
+            return None
+        values: dict[str, str | int] = m.groupdict()
+        for part in self.parts:
+            if isinstance(part, tuple) and part[1] is not None:
+                try:
+                    values[part[0]] = int(values[part[0]]) - part[1]
+                except ValueError:
+                    return None
+        return values
+
+    def format(self, values: dict[str, str | int]) -> str | None:
+        """returns the port name for the values of the placeholders,
+        None if it doesn't match the pattern, e.g. because of a negative channel"""
+        name = []
+        for part in self.parts:
+            if isinstance(part, str):
+                name.append(part)
+                continue
+            value = values[part[0]]
+            if part[1] is not None:
+                try:
+                    value = int(value) + part[1]
+                except ValueError:
+                    return None
+            if isinstance(value, int) and value < 0:
+                return None
+            name.append(str(value))
+        port_name = "".join(name)
+        return port_name if self.regex.fullmatch(port_name) else None
+
+
+@cache
+def compile_pattern(pattern: str) -> Template:
+    """compiled once per pattern, e.g. for the profiles that share a rule"""
+    return Template(pattern)
+
+
+def compile_pattern_rule(rule: PatternRule) -> tuple[Template, Template]:
+    """raises ValueError if a pattern is invalid or the placeholders don't map"""
+    source = compile_pattern(rule.source)
+    sink = compile_pattern(rule.sink)
+    if not sink.fields <= source.fields:
+        raise ValueError(
+            f"the placeholders of {rule.sink!r} must all be used in {rule.source!r}"
+        )
+    return source, sink
+
+
+class PatternIndex:
+    """entries of patterns, looked up by the port names the patterns can match.
+
+    patterns are indexed by the literal text they start and end with, e.g.
+    wfs:in_{ch}_r1 by ("wfs:in_", "_r1"), so a port name is only matched against
+    the patterns that share its beginning and end. patterns that start and end
+    with a placeholder are indexed by their first literal text, which has to
+    occur in the port name.
+    """
+
+    def __init__(self) -> None:
+        # (prefix, suffix) -> entries
+        self.anchored: dict[tuple[str, str], list] = {}
+        # lengths of the prefixes, and of the suffixes of the patterns with a prefix
+        self.prefix_lengths: list[int] = []
+        self.suffix_lengths: dict[str, list[int]] = {}
+        # first literal text -> entries, of patterns without prefix and suffix,
+        # looked up by the parts of the port name of the lengths of these texts
+        self.segments: dict[str, list] = {}
+        self.segment_lengths: list[int] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.anchored or self.segments)
+
+    def add(self, pattern: Template, entry):
+        prefix, suffix = pattern.prefix, pattern.suffix
+        if not prefix and not suffix:
+            segment = next(
+                (part for part in pattern.parts if isinstance(part, str) and part), ""
+            )
+            self.segments.setdefault(segment, []).append(entry)
+            if len(segment) not in self.segment_lengths:
+                insort(self.segment_lengths, len(segment))
+            return
+        self.anchored.setdefault((prefix, suffix), []).append(entry)
+        if prefix not in self.suffix_lengths:
+            if len(prefix) not in self.prefix_lengths:
+                insort(self.prefix_lengths, len(prefix))
+            self.suffix_lengths[prefix] = []
+        if len(suffix) not in self.suffix_lengths[prefix]:
+            insort(self.suffix_lengths[prefix], len(suffix))
+
+    def candidates(self, name: str) -> Iterator:
+        """yields the entries of all patterns that can match the port name"""
+        n = len(name)
+        for length in self.prefix_lengths:
+            if length > n:
+                break
+            prefix = name[:length]
+            for suffix_length in self.suffix_lengths.get(prefix, ()):
+                if length + suffix_length > n:
+                    break
+                yield from self.anchored.get((prefix, name[n - suffix_length :]), ())
+        if not self.segments:
+            return
+        # a pattern is yielded once even if its text occurs several times
+        seen = set()
+        for length in self.segment_lengths:
+            for start in range(n - length + 1):
+                segment = name[start : start + length]
+                if segment not in seen and segment in self.segments:
+                    seen.add(segment)
+                    yield from self.segments[segment]
+
+
+def parse_config(conf: list[dict]) -> list[Rule | PatternRule]:
+    """converts the contents of a connection file into a list of rules"""
+    rules: list[Rule | PatternRule] = []
+    for source_client in conf:
+        source_start_index = source_client.get("start_index", 1)
+        source_priority = source_client.get("priority", 0)
+        if "pattern" in source_client:
+            for sink_client in source_client["connections"]:
+                rule = PatternRule(
+                    source_client["pattern"],
+                    sink_client["pattern"],
+                    int(sink_client.get("priority", source_priority)),
+                )
+                compile_pattern_rule(rule)
+                rules.append(rule)
+            continue
+        for sink_client in source_client["connections"]:
+            rules.append(
+                Rule(
+                    source_client["client"],
+                    source_start_index,
+                    source_client["n_channels"],
+                    sink_client["client"],
+                    sink_client.get("start_index", 1),
+                    int(sink_client.get("priority", source_priority)),
+                )
+            )
+    return rules
+
+
+def expand(rules: Iterable[Rule | PatternRule]) -> Iterator[tuple[str, str]]:
+    """yields the (source, sink) port name tuples of all channels of the rules,
+    pattern rules depend on the existing ports and are skipped"""
+    for rule in rules:
+        if isinstance(rule, PatternRule):
+            continue
+        for i in range(rule.count):
+            yield (
+                f"{rule.source_prefix}{rule.source_start + i}",
+                f"{rule.sink_prefix}{rule.sink_start + i}",
+            )
+
+
+def split_port_name(name: str) -> Iterator[tuple[str, int]]:
+    """yields all possible (prefix, channel) splits of a port name.
+    there can be several, e.g. out12 can be channel 12 of out or channel 2 of out1."""
+    n_digits = len(name) - len(name.rstrip("0123456789"))
+    for i in range(len(name) - n_digits, len(name)):
+        # channel numbers are never written with leading zeros
+        if name[i] == "0" and i < len(name) - 1:
+            continue
+        yield name[:i], int(name[i:])
+
+
+class RuleIndex:
+    """index of channel ranges for looking up the peers of a port by name.
+
+    instead of expanding every rule into one port name per channel, each rule
+    is stored as a range under both its source and sink prefix. the peers of a
+    port are computed on demand from its prefix and channel number.
+
+    pattern rules are indexed by the literal text of their patterns, see
+    PatternIndex, so a port name is only matched against the patterns it can match.
+    """
+
+    def __init__(self, rules: list[Rule | PatternRule]) -> None:
+        self.rules = rules
+        # prefix -> [(start, count, peer prefix, peer start, prefix is the source)]
+        self.ranges: dict[str, list[tuple[int, int, str, int, bool]]] = {}
+        # prefix -> [(start, count, peer prefix, peer start, priority)],
+        # only for the rules with a priority
+        self.priorities: dict[str, list[tuple[int, int, str, int, int]]] = {}
+        # (pattern, peer pattern, pattern is the source, priority)
+        self.patterns = PatternIndex()
+        # (sink pattern, source pattern, priority) of the rules whose sink pattern
+        # leaves out placeholders, their sources are found among the existing ports
+        self.fan_in = PatternIndex()
+        for rule in rules:
+            if isinstance(rule, PatternRule):
+                source, sink = compile_pattern_rule(rule)
+                self.patterns.add(source, (source, sink, True, rule.priority))
+                if sink.fields == source.fields:
+                    self.patterns.add(sink, (sink, source, False, rule.priority))
+                else:
+                    self.fan_in.add(sink, (sink, source, rule.priority))
+                continue
+            self.ranges.setdefault(rule.source_prefix, []).append(
+                (rule.source_start, rule.count, rule.sink_prefix, rule.sink_start, True)
+            )
+            self.ranges.setdefault(rule.sink_prefix, []).append(
+                (
+                    rule.sink_start,
+                    rule.count,
+                    rule.source_prefix,
+                    rule.source_start,
+                    False,
+                )
+            )
+            if rule.priority:
+                self.priorities.setdefault(rule.source_prefix, []).append(
+                    (
+                        rule.source_start,
+                        rule.count,
+                        rule.sink_prefix,
+                        rule.sink_start,
+                        rule.priority,
+                    )
+                )
+                self.priorities.setdefault(rule.sink_prefix, []).append(
+                    (
+                        rule.sink_start,
+                        rule.count,
+                        rule.source_prefix,
+                        rule.source_start,
+                        rule.priority,
+                    )
+                )
+
+    def _pattern_matches(self, name: str) -> Iterator[tuple[str, bool, int]]:
+        for pattern, peer, is_source, priority in self.patterns.candidates(name):
+            values = pattern.match(name)
+            if values is not None:
+                peer_name = peer.format(values)
+                if peer_name is not None:
+                    yield peer_name, is_source, priority
+
+    def _fan_in_matches(
+        self, name: str, port_names: Iterable[str]
+    ) -> Iterator[tuple[str, int]]:
+        """yields the sources among port_names of a sink port of fan-in rules"""
+        for pattern, peer, priority in self.fan_in.candidates(name):
+            if pattern.match(name) is None:
+                continue
+            for source in port_names:
+                if source.startswith(peer.prefix) and source.endswith(peer.suffix):
+                    values = peer.match(source)
+                    if values is not None and pattern.format(values) == name:
+                        yield source, priority
+
+    def _matches(self, name: str) -> Iterator[tuple[str, bool]]:
+        for prefix, channel in split_port_name(name):
+            for start, count, peer_prefix, peer_start, is_source in self.ranges.get(
+                prefix, ()
+            ):
+                if start <= channel < start + count:
+                    yield f"{peer_prefix}{peer_start + channel - start}", is_source
+        if self.patterns:
+            for peer, is_source, _ in self._pattern_matches(name):
+                yield peer, is_source
+
+    def __contains__(self, name: str) -> bool:
+        return next(self._matches(name), None) is not None or any(
+            pattern.match(name) is not None
+            for pattern, _, _ in self.fan_in.candidates(name)
+        )
+
+    def peers(self, name: str, port_names: Iterable[str] = ()) -> set[str]:
+        """returns the names of all ports that should be connected to the port.
+        the sources of a sink of rules whose sink pattern leaves out placeholders
+        are only found among port_names, which are matched one by one."""
+        peers = {peer for peer, _ in self._matches(name)}
+        if self.fan_in:
+            peers.update(source for source, _ in self._fan_in_matches(name, port_names))
+        return peers
+
+    def priority(self, a: str, b: str) -> int:
+        """returns the highest priority of the rules with a priority connecting
+        the ports a and b, 0 if there are none"""
+        if not self.priorities and not self.patterns:
+            return 0
+        priority = None
+        for prefix, channel in split_port_name(a):
+            for (
+                start,
+                count,
+                peer_prefix,
+                peer_start,
+                rule_priority,
+            ) in self.priorities.get(prefix, ()):
+                if (
+                    start <= channel < start + count
+                    and f"{peer_prefix}{peer_start + channel - start}" == b
+                    and (priority is None or rule_priority > priority)
+                ):
+                    priority = rule_priority
+        if self.patterns:
+            for peer, _, rule_priority in self._pattern_matches(a):
+                if (
+                    peer == b
+                    and rule_priority
+                    and (priority is None or rule_priority > priority)
+                ):
+                    priority = rule_priority
+        return 0 if priority is None else priority
+
+    def sources(self) -> set[str] | None:
+        """returns the names of all source ports, None if there are
+        pattern rules, their sources are only known from the existing ports"""
+        if self.patterns:
+            return None
+        return {
+            f"{rule.source_prefix}{rule.source_start + i}"
+            for rule in self.rules
+            for i in range(rule.count)
+        }
+
+    def edges(self, port_names: Iterable[str] = ()) -> Iterator[tuple[str, str]]:
+        """yields all (source, sink) port name tuples, duplicates included.
+        pattern rules only yield the edges of the sources among port_names."""
+        yield from expand(self.rules)
+        if self.patterns:
+            for name in port_names:
+                for peer, is_source, _ in self._pattern_matches(name):
+                    if is_source:
+                        yield name, peer
@@ -0,0 +1,114 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from time import monotonic
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jack_connection_manager.tracing import EdgeTracer
+
+Edge = tuple[str, str]
+
+
+class ConnectionQueue:
+    """queue of (output, input) edges waiting to be connected, ordered by priority.
+
+    edges of a higher priority always come first. within a priority level the
+    clients of the outputs take turns, so a client with hundreds of queued edges
+    doesn't hold up the others. records how long each level took to drain.
+    has the parts of the interface of asyncio.Queue the connection manager uses,
+    all methods have to be called from the thread running the loop.
+    """
+
+    def __init__(
+        self, priority: Callable[[Edge], int], tracer: "EdgeTracer | None" = None
+    ) -> None:
+        """priority is called with every queued edge and returns its priority,
+        a tracer records every queued edge"""
+        self.priority = priority
+        self.tracer = tracer
+        # priority -> client -> edges
+        self.levels: dict[int, dict[str, deque[Edge]]] = {}
+        # priority -> clients with queued edges, the first one takes the next turn
+        self.turns: dict[int, deque[str]] = {}
+        # priorities of the levels, highest first
+        self.order: list[int] = []
+        self.size = 0
+        # time the first edge of the last burst was queued into each level
+        self.level_started: dict[int, float] = {}
+        # seconds the last burst of each level took from its first queued edge
+        # until its last edge was taken from the queue, including retries
+        self.converge_times: dict[int, float] = {}
+        self.waiter: asyncio.Future | None = None
+
+    def qsize(self) -> int:
+        return self.size
+
+    def empty(self) -> bool:
+        return not self.size
+
+    def put_nowait(self, edge: Edge, retry: bool = False):
+        """queues the edge, a retry of a failed attempt belongs to the burst
+        of its level that was queued before"""
+        priority = self.priority(edge)
+        level = self.levels.get(priority)
+        if level is None:
+            level = self.levels[priority] = {}
+            self.turns[priority] = deque()
+            self.order = sorted(self.levels, reverse=True)
+            if not retry or priority not in self.level_started:
+                self.level_started[priority] = monotonic()
+        client = edge[0].partition(":")[0]
+        edges = level.get(client)
+        if edges is None:
+            edges = level[client] = deque()
+            self.turns[priority].append(client)
+        edges.append(edge)
+        self.size += 1
+        if self.tracer is not None:
+            self.tracer.queued(edge, priority)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def get_nowait(self) -> Edge:
+        if not self.size:
+            raise asyncio.QueueEmpty
+        priority = self.order[0]
+        level = self.levels[priority]
+        turns = self.turns[priority]
+        client = turns.popleft()
+        edges = level[client]
+        edge = edges.popleft()
+        if edges:
+            # the client moves to the end of the line
+            turns.append(client)
+        else:
+            del level[client]
+        if not level:
+            del self.levels[priority]
+            del self.turns[priority]
+            self.order.pop(0)
+            self.converge_times[priority] = monotonic() - self.level_started[priority]
+        self.size -= 1
+        return edge
+
+    def retry(self, edge: Edge):
+        self.put_nowait(edge, retry=True)
+
+    async def get(self) -> Edge:
+        """returns the next edge, without suspending if the queue isn't empty"""
+        while not self.size:
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.get_nowait()
+
+    def clear(self):
+        """drops all queued edges"""
+        self.levels.clear()
+        self.turns.clear()
+        self.order.clear()
+        self.level_started.clear()
+        self.size = 0
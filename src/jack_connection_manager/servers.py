@@ -0,0 +1,233 @@
+import asyncio
+import concurrent.futures
+import logging
+from collections.abc import Callable
+from pathlib import Path
+from threading import Lock, Thread
+from time import monotonic
+
+from jack_connection_manager.ConnectionManager import ConnectionManager
+from jack_connection_manager.config import ProfileError, SharedRules
+from jack_connection_manager.metrics import merge_expositions
+
+log = logging.getLogger()
+
+# seconds the group waits for the loops of the servers to render their metrics
+metrics_timeout = 1
+
+
+class ServerGroup:
+    """manages several jack servers from one process.
+
+    every server gets its own connection manager with its own client, reconciler
+    and retry scheduler, running its event loop on its own thread, so a slow or
+    restarting server doesn't hold up the others. managers using the same
+    connection file share the compiled rules.
+    the group's own loop runs on the main thread and handles signals and
+    services for all servers, e.g. a metrics.MetricsExporter.
+    """
+
+    def __init__(
+        self,
+        servers: dict[str, Path],
+        setup: Callable[[ConnectionManager], None] | None = None,
+        server_options: dict[str, dict] | None = None,
+        **options,
+    ) -> None:
+        """servers maps the server names to their connection files, setup is called
+        on the thread of each server once its connection manager was created.
+        options are passed to the connection managers, server_options maps
+        server names to options for only that server."""
+        self.servers = servers
+        self.setup = setup
+        self.options = options
+        self.server_options = server_options or {}
+        self.shared_rules = SharedRules()
+        self.loop = asyncio.new_event_loop()
+        self.managers: dict[str, ConnectionManager] = {}
+        self.lock = Lock()
+        self.stopping = False
+        # servers whose thread ended, and those that couldn't be reached at all
+        self.finished: set[str] = set()
+        self.failed: set[str] = set()
+        self.stopped = asyncio.Event()
+        # time each server's loop last answered a health check, see is_healthy
+        self.heartbeats: dict[str, float] = {}
+        # objects with a stop() method that are stopped on the loop when shutting down
+        self.services: list = []
+        # called on the loop of the group when the progress of a server changed
+        self.progress_listeners: list[Callable[[], None]] = []
+        # (converged, progress) of each server, taken on the loop of the server
+        self.states: dict[str, tuple[bool, str]] = {}
+        self.threads = [
+            Thread(target=self.run_server, args=(name,), name=name, daemon=True)
+            for name in servers
+        ]
+
+    def run_server(self, servername: str):
+        try:
+            cm = ConnectionManager(
+                self.servers[servername],
+                servername=servername,
+                shared_rules=self.shared_rules,
+                **{**self.options, **self.server_options.get(servername, {})},
+            )
+        except (SystemExit, ProfileError) as e:
+            # the manager exits when the server can't be reached, only this thread ends
+            if isinstance(e, ProfileError):
+                log.error(str(e))
+            log.error(f"giving up on jack server {servername}")
+            self.failed.add(servername)
+            self.call_threadsafe(self.server_stopped, servername)
+            return
+
+        try:
+            if self.setup is not None:
+                self.setup(cm)
+
+            def report():
+                # the state is only read on the loop of the server, which changes it
+                self.call_threadsafe(
+                    self.server_progress, servername, cm.is_converged(), cm.progress()
+                )
+
+            cm.progress_listeners.append(report)
+            cm.call_threadsafe(report)
+            with self.lock:
+                self.managers[servername] = cm
+                stopping = self.stopping
+            if stopping:
+                cm.deactivate()
+            cm.connection_loop()
+        finally:
+            self.call_threadsafe(self.server_stopped, servername)
+
+    def call_threadsafe(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop was already closed
+            pass
+
+    def server_stopped(self, servername: str):
+        self.finished.add(servername)
+        self.progress_changed()
+        self.check_stopped()
+
+    def server_progress(self, servername: str, converged: bool, progress: str):
+        self.states[servername] = (converged, progress)
+        self.progress_changed()
+
+    def progress_changed(self):
+        for listener in self.progress_listeners:
+            listener()
+
+    def check_stopped(self):
+        waiting = self.servers.keys() - self.finished
+        if self.stopping:
+            # servers that are still waiting for their jack server to start are abandoned
+            waiting &= self.managers.keys()
+        if not waiting:
+            self.stopped.set()
+
+    def deactivate(self, *args):
+        """stops all connection managers, runs on the loop of the group"""
+        with self.lock:
+            self.stopping = True
+            managers = list(self.managers.values())
+        for cm in managers:
+            cm.deactivate()
+        self.check_stopped()
+
+    def reload(self, *args):
+        """reloads the connection files of all servers"""
+        for cm in list(self.managers.values()):
+            cm.watcher.trigger()
+
+    def next_profile(self, *args):
+        """switches all servers to the next profile of their connection file"""
+        for cm in list(self.managers.values()):
+            cm.call_threadsafe(cm.next_profile)
+
+    def is_converged(self) -> bool:
+        """True once every server that could be reached converged"""
+        return all(
+            servername in self.failed or self.states.get(servername, (False,))[0]
+            for servername in self.servers
+        )
+
+    def is_healthy(self, max_delay: float) -> bool:
+        """False if the loop of a server didn't answer a health check or reported
+        to be unhealthy within max_delay seconds. every call sends the next
+        health check to the servers, so it has to be called regularly."""
+        now = monotonic()
+        healthy = True
+        for servername, cm in list(self.managers.items()):
+            if now - self.heartbeats.setdefault(servername, now) > max_delay:
+                log.warning(f"jack server {servername} is not healthy")
+                healthy = False
+            cm.call_threadsafe(self.check_health, servername, cm, max_delay)
+        return healthy
+
+    def check_health(self, servername: str, cm: ConnectionManager, max_delay: float):
+        """runs on the loop of the server"""
+        if cm.is_healthy(max_delay):
+            self.call_threadsafe(self.heartbeat, servername)
+
+    def heartbeat(self, servername: str):
+        self.heartbeats[servername] = monotonic()
+
+    def progress(self) -> str:
+        """the progress of all servers in a line, e.g. for systemd"""
+        progress = []
+        for servername in self.servers:
+            state = self.states.get(servername)
+            if servername in self.failed:
+                progress.append(f"{servername}: gave up")
+            elif state is None:
+                progress.append(f"{servername}: connecting")
+            else:
+                progress.append(f"{servername}: {state[1]}")
+        return "; ".join(progress)
+
+    def render_metrics(self) -> str:
+        """returns the metrics of all servers with a server label. each server
+        renders them on its own loop, a server whose loop doesn't answer within
+        metrics_timeout seconds is left out."""
+        futures = {}
+        for servername, cm in list(self.managers.items()):
+            try:
+                futures[servername] = asyncio.run_coroutine_threadsafe(
+                    render_metrics(cm, (("server", servername),)), cm.loop
+                )
+            except RuntimeError:
+                # the loop of the server was already closed
+                pass
+
+        deadline = monotonic() + metrics_timeout
+        texts = []
+        for servername, future in futures.items():
+            try:
+                texts.append(future.result(max(0.0, deadline - monotonic())))
+            except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+                future.cancel()
+                log.warning(f"jack server {servername} didn't render its metrics")
+        return merge_expositions(texts)
+
+    async def run(self):
+        for thread in self.threads:
+            thread.start()
+        await self.stopped.wait()
+        for service in self.services:
+            service.stop()
+
+    def connection_loop(self):
+        """runs the loop of the group until all servers stopped"""
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
+
+
+async def render_metrics(cm: ConnectionManager, const_labels) -> str:
+    return cm.render_metrics(const_labels)
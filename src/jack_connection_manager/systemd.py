@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+from time import monotonic
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jack_connection_manager.ConnectionManager import ConnectionManager
+    from jack_connection_manager.servers import ServerGroup
+
+log = logging.getLogger()
+
+# seconds after a status update before the next one is sent,
+# changes in between are reported together
+status_interval = 1
+
+
+def watchdog_interval() -> float | None:
+    """the watchdog timeout in seconds systemd expects pings for, from the
+    environment of the unit, None if the unit has no WatchdogSec"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6
+
+
+class ServiceNotifier:
+    """reports the state of a connection manager or a server group to systemd,
+    on the loop of the manager. only needed if systemd set NOTIFY_SOCKET.
+
+    READY=1 is only sent once the initial sync converged, or after ready_timeout
+    seconds if it doesn't, so units ordered after this one don't start against
+    a half routed graph. STATUS= reports the progress of the wanted connections,
+    e.g. 1480/1536 edges, 12 pending. both are sent when the manager reports
+    a change of its progress, e.g. a convergence, queued connections or a lost
+    server, without polling it, and the status at most every status_interval
+    seconds while connections are made. with WatchdogSec in the unit,
+    WATCHDOG=1 is sent at half that interval as long as the manager reports
+    to be healthy, a blocked loop sends nothing and systemd restarts the service.
+    """
+
+    def __init__(
+        self,
+        manager: "ConnectionManager | ServerGroup",
+        notify: Callable[[str], None],
+        ready_timeout: float,
+    ) -> None:
+        """notify sends a message to systemd, e.g. sdnotify.SystemdNotifier.notify"""
+        self.manager = manager
+        self.loop = manager.loop
+        self.notify = notify
+        self.ready_timeout = ready_timeout
+        self.started = monotonic()
+        self.ready = False
+        self.status: str | None = None
+        self.status_timer: asyncio.TimerHandle | None = None
+        self.status_changed = False
+        manager.progress_listeners.append(self.update)
+        self.ready_timer = self.loop.call_later(ready_timeout, self.ready_timed_out)
+        self.watchdog = watchdog_interval()
+        self.watchdog_timer = None
+        if self.watchdog is not None:
+            log.info(f"sending watchdog pings every {self.watchdog / 2:.1f} s")
+            self.watchdog_timer = self.loop.call_soon(self.ping)
+        # the initial sync might have converged before the loop started
+        self.loop.call_soon(self.update)
+
+    def update(self):
+        """sends READY=1 once the manager converged and the progress if it changed"""
+        if not self.ready and self.manager.is_converged():
+            self.send_ready()
+            # the status of the converged sync goes out together with the readiness
+            self.report()
+        elif self.status_timer is not None:
+            self.status_changed = True
+        else:
+            self.report()
+
+    def report(self):
+        status = self.manager.progress()
+        if status == self.status:
+            return
+        self.status = status
+        self.notify(f"STATUS={status}")
+        if self.status_timer is None:
+            self.status_timer = self.loop.call_later(status_interval, self.status_due)
+
+    def status_due(self):
+        self.status_timer = None
+        if self.status_changed:
+            self.status_changed = False
+            self.update()
+
+    def ready_timed_out(self):
+        if self.ready:
+            return
+        if self.ready_timeout:
+            log.warning(
+                f"initial sync did not converge within {self.ready_timeout} s, "
+                "reporting ready anyway"
+            )
+        self.send_ready()
+        self.update()
+
+    def ping(self):
+        self.watchdog_timer = self.loop.call_later(self.watchdog / 2, self.ping)
+        if self.manager.is_healthy(self.watchdog):
+            self.notify("WATCHDOG=1")
+
+    def send_ready(self):
+        self.ready = True
+        self.ready_timer.cancel()
+        self.notify("READY=1")
+        log.info(f"reported ready after {monotonic() - self.started:.2f} s")
+
+    def stop(self):
+        self.ready_timer.cancel()
+        if self.status_timer is not None:
+            self.status_timer.cancel()
+        if self.watchdog_timer is not None:
+            self.watchdog_timer.cancel()
+        self.notify("STOPPING=1")
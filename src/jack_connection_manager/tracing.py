@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from time import perf_counter
+
+log = logging.getLogger()
+
+# recording stops after this many events, so tracing a long running
+# connection manager can't use up the memory
+max_events = 2_000_000
+# seconds to wait after a convergence before writing the trace,
+# so a burst of convergences is written once
+write_delay = 1
+
+Edge = tuple[str, str]
+
+
+class EdgeTracer:
+    """records the lifecycle of every wanted connection and writes it as a
+    chrome trace, which can be opened with https://ui.perfetto.dev or chrome://tracing.
+
+    every edge is an async track from being queued until jack confirmed the
+    connection, with the connect attempts and their jack error codes nested
+    inside. port registrations and reconcile passes are on a track of their own.
+    events are stored as tuples and only converted when writing. the trace is
+    written after every convergence and when the connection manager stops.
+    all methods except port_registered have to be called from the thread running the loop.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        path: Path,
+        servername: str | None = None,
+    ) -> None:
+        self.loop = loop
+        self.path = Path(path)
+        self.servername = servername
+        self.started = perf_counter()
+        # (phase, name, perf_counter time, edge id, argument name, argument value)
+        # tuples, the name of an edge track is the edge itself to save memory
+        self.events: list[tuple] = []
+        # id of the open track of every queued edge
+        self.edge_ids: dict[Edge, int] = {}
+        self.next_id = 1
+        self.full = False
+        self.write_timer: asyncio.TimerHandle | None = None
+        log.info(f"tracing connections to {self.path}")
+
+    def record(
+        self,
+        phase: str,
+        name: str | Edge,
+        edge_id: int = 0,
+        arg: str | None = None,
+        value=None,
+        t: float | None = None,
+    ):
+        if len(self.events) >= max_events:
+            if not self.full:
+                self.full = True
+                log.warning(f"trace has {max_events} events, stopped recording")
+            return
+        if t is None:
+            t = perf_counter()
+        self.events.append((phase, name, t, edge_id, arg, value))
+
+    def port_registered(self, name: str, registered: bool):
+        """called on the jack notification thread, appending to the list is atomic"""
+        self.record(
+            "i", "registered" if registered else "unregistered", 0, "port", name
+        )
+
+    def reconcile(self, t_start: float, n_events: int):
+        """records a reconcile pass that started at t_start (perf_counter)"""
+        self.record("B", "reconcile", t=t_start)
+        self.record("E", "reconcile", 0, "events", n_events)
+
+    def queued(self, edge: Edge, priority: int):
+        edge_id = self.edge_ids.get(edge)
+        if edge_id is not None:
+            # queued again by a retry or the strict mode
+            self.record("n", "queued", edge_id, "priority", priority)
+            return
+        edge_id = self.edge_ids[edge] = self.next_id
+        self.next_id += 1
+        self.record("b", edge, edge_id, "priority", priority)
+
+    def connect(self, edge: Edge, t_start: float, error: int | None = None):
+        """records a connect attempt that started at t_start (perf_counter)"""
+        edge_id = self.edge_ids.get(edge)
+        if edge_id is None:
+            return
+        self.record("b", "connect", edge_id, t=t_start)
+        self.record("e", "connect", edge_id, "error", error)
+
+    def end(self, edge: Edge, state: str):
+        """closes the track of the edge, state is e.g. confirmed or failed"""
+        edge_id = self.edge_ids.pop(edge, None)
+        if edge_id is not None:
+            self.record("e", edge, edge_id, "state", state)
+
+    def end_all(self, state: str):
+        for edge in list(self.edge_ids):
+            self.end(edge, state)
+
+    def schedule_write(self):
+        if self.write_timer is None:
+            self.write_timer = self.loop.call_later(write_delay, self.write)
+
+    def trace_events(self) -> Iterator[dict]:
+        pid = os.getpid()
+        process_name = "jack-connection-manager"
+        if self.servername is not None:
+            process_name = f"{process_name} {self.servername}"
+        yield {
+            "ph": "M",
+            "name": "process_name",
+            "pid": pid,
+            "args": {"name": process_name},
+        }
+        yield {
+            "ph": "M",
+            "name": "thread_name",
+            "pid": pid,
+            "tid": 1,
+            "args": {"name": "ports"},
+        }
+        for phase, name, t, edge_id, arg, value in self.events:
+            event = {
+                "ph": phase,
+                "name": name if isinstance(name, str) else f"{name[0]} -> {name[1]}",
+                "ts": round((t - self.started) * 1e6, 3),
+                "pid": pid,
+                "tid": 1,
+            }
+            if edge_id:
+                event["cat"] = "edge"
+                event["id"] = edge_id
+            elif phase == "i":
+                event["s"] = "t"
+            if arg is not None:
+                event["args"] = {arg: value}
+            yield event
+
+    def write(self):
+        self.write_timer = None
+        # written to a temporary file first, so a viewer never reads half a file
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        try:
+            with tmp_path.open("w") as f:
+                # written event by event, the whole trace can be large
+                f.write('{"displayTimeUnit": "ms", "traceEvents": [')
+                separator = "\n"
+                for event in self.trace_events():
+                    f.write(separator + json.dumps(event))
+                    separator = ",\n"
+                f.write("\n]}\n")
+            tmp_path.replace(self.path)
+        except OSError as e:
+            log.warning(f"could not write trace to {self.path}: {e}")
+
+    def stop(self):
+        if self.write_timer is not None:
+            self.write_timer.cancel()
+        self.write()
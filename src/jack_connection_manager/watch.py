@@ -0,0 +1,115 @@
+import asyncio
+import ctypes
+import logging
+import os
+import struct
+from collections.abc import Callable
+from pathlib import Path
+
+log = logging.getLogger()
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+inotify_event = struct.Struct("iIII")
+
+# changes arriving within this time in seconds are handled together
+settle_time = 0.1
+
+
+def open_inotify(directory: Path) -> int | None:
+    """returns an inotify file descriptor watching the directory for changed files,
+    or None if inotify is not available"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    # the directory is watched because editors often replace the file
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+        log.warning(f"could not watch {directory}: {os.strerror(ctypes.get_errno())}")
+        os.close(fd)
+        return None
+    return fd
+
+
+def read_names(fd: int) -> set[str]:
+    """reads all pending inotify events and returns the names of the changed files"""
+    names = set()
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = inotify_event.unpack_from(data, offset)
+            offset += inotify_event.size
+            names.add(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+
+
+class ConfigWatcher:
+    """calls callback on the event loop when the config file changed or trigger() was called.
+    changes are detected with inotify, if it isn't available only trigger() works."""
+
+    def __init__(
+        self,
+        config_path: Path,
+        callback: Callable[[], None],
+        loop: asyncio.AbstractEventLoop,
+        use_inotify=True,
+    ):
+        self.config_path = Path(config_path)
+        self.callback = callback
+        self.loop = loop
+        # timer running the callback once no further changes arrived
+        self.settle_timer: asyncio.TimerHandle | None = None
+        self.inotify_fd = None
+        if use_inotify:
+            self.inotify_fd = open_inotify(self.config_path.parent)
+            if self.inotify_fd is None:
+                log.warning("inotify is not available, reload the config with SIGHUP")
+            else:
+                loop.add_reader(self.inotify_fd, self.read_events)
+
+    def read_events(self):
+        if self.config_path.name in read_names(self.inotify_fd):
+            self.changed()
+
+    def changed(self):
+        # wait until the file was completely written
+        if self.settle_timer is not None:
+            self.settle_timer.cancel()
+        self.settle_timer = self.loop.call_later(settle_time, self.run_callback)
+
+    def trigger(self, *args):
+        """can be called from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self.changed)
+        except RuntimeError:
+            # the loop was already closed
+            pass
+
+    def run_callback(self):
+        self.settle_timer = None
+        try:
+            self.callback()
+        except Exception:
+            log.exception("error while reloading the config")
+
+    def stop(self):
+        if self.settle_timer is not None:
+            self.settle_timer.cancel()
+        if self.inotify_fd is not None:
+            self.loop.remove_reader(self.inotify_fd)
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
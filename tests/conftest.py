@@ -0,0 +1,97 @@
+import logging
+import threading
+from pathlib import Path
+
+import pytest
+import yaml
+
+from jack_connection_manager.ConnectionManager import ConnectionManager
+from jack_connection_manager.fake_jack import FakeJack, FakeServer
+
+
+def client_config(source: str, n_channels: int, sinks: list[str]) -> dict:
+    """a client entry of the connection file connecting source to every sink"""
+    return {
+        "client": source,
+        "n_channels": n_channels,
+        "connections": [{"client": sink} for sink in sinks],
+    }
+
+
+def add_client_ports(server: FakeServer, prefix: str, n_channels: int, is_output):
+    for channel in range(1, n_channels + 1):
+        server.add_port(f"{prefix}{channel}", is_output)
+
+
+class Setup:
+    """a connection manager on a fake jack server, with the loop running
+    in a thread after start()"""
+
+    def __init__(self, tmp_path: Path) -> None:
+        self.config_path = tmp_path / "connections.yml"
+        self.backend = FakeJack()
+        self.server = self.backend.server()
+        self.cm: ConnectionManager | None = None
+        self.thread: threading.Thread | None = None
+
+    def write_config(self, config):
+        self.config_path.write_text(yaml.dump(config))
+
+    def manager(self, **kwargs) -> ConnectionManager:
+        self.server.flush()
+        self.cm = ConnectionManager(
+            self.config_path, backend=self.backend, watch_config=False, **kwargs
+        )
+        self.server.flush()
+        return self.cm
+
+    def start(self):
+        self.thread = threading.Thread(target=self.cm.connection_loop)
+        self.thread.start()
+
+    def on_loop(self, function, *args):
+        """runs function on the loop of the running manager and returns its result"""
+        done = threading.Event()
+        result = []
+
+        def run():
+            result.append(function(*args))
+            done.set()
+
+        self.cm.loop.call_soon_threadsafe(run)
+        assert done.wait(5)
+        return result[0]
+
+    def settle(self, timeout: float = 5):
+        """waits until the callbacks ran, the reconcile pass is done and
+        the queue is empty"""
+        self.server.flush()
+        cm = self.cm
+        for _ in range(int(timeout / 0.01)):
+            self.server.flush()
+            busy = self.on_loop(
+                lambda: bool(cm.incoming or cm.port_events or cm.removed_edges)
+                or cm.reconcile_timer is not None
+                or not cm.queue.empty()
+            )
+            if not busy:
+                return
+            threading.Event().wait(0.01)
+        raise TimeoutError("the connection manager didn't settle")
+
+    def stop(self):
+        if self.cm is None:
+            return
+        self.cm.deactivate()
+        if self.thread is not None:
+            self.thread.join(5)
+        else:
+            self.cm.loop.close()
+
+
+@pytest.fixture
+def setup(tmp_path):
+    logging.getLogger().setLevel(logging.WARNING)
+    setup = Setup(tmp_path)
+    yield setup
+    setup.stop()
@@ -0,0 +1,52 @@
+import pytest
+import yaml
+
+from conftest import add_client_ports, client_config
+from jack_connection_manager.check import Severity, run_check
+from jack_connection_manager.fake_jack import FakeJack
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "connections.yml"
+    path.write_text(
+        yaml.dump(
+            {
+                "profiles": {
+                    "a": [client_config("src:out_", 2, ["sink:in_"])],
+                }
+            }
+        )
+    )
+    return path
+
+
+def check(config_path, **kwargs) -> Severity:
+    backend = FakeJack()
+    server = backend.server()
+    add_client_ports(server, "src:out_", 2, is_output=True)
+    add_client_ports(server, "sink:in_", 2, is_output=False)
+    server.connect("src:out_1", "sink:in_1")
+    return run_check(config_path, "check", backend=backend, **kwargs)
+
+
+def test_missing_connections_are_critical(config_path, capsys):
+    assert check(config_path) == Severity.CRITICAL
+    assert "src:out_2" in capsys.readouterr().out
+
+
+def test_unknown_profile_is_unknown(config_path):
+    assert check(config_path, profile="typo") == Severity.UNKNOWN
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["- client: [unclosed", "- client: src:out_\n  n_channels: 2\n", "42"],
+)
+def test_broken_connection_file_is_unknown(config_path, content):
+    config_path.write_text(content)
+    assert check(config_path, use_config_cache=False) == Severity.UNKNOWN
+
+
+def test_missing_connection_file_is_unknown(tmp_path):
+    assert check(tmp_path / "missing.yml") == Severity.UNKNOWN
@@ -0,0 +1,19 @@
+import pytest
+from click.testing import CliRunner
+
+from jack_connection_manager.jack_connection_manager import main
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["-n"], "needs -r or --enforce"),
+        (["--dry-run", "-e", "system"], "needs -r or --enforce"),
+        (["-r", "--enforce"], "can't be combined"),
+        (["-r", "--enforce", "-n"], "can't be combined"),
+    ],
+)
+def test_conflicting_options_are_rejected(args, message):
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 2
+    assert message in result.output
@@ -0,0 +1,173 @@
+from time import sleep
+
+import pytest
+
+from conftest import add_client_ports, client_config
+from jack_connection_manager import ConnectionManager as connection_manager
+from jack_connection_manager.edges import EdgeState
+
+n_channels = 8
+
+
+def wanted(source: str, sink: str, n: int = n_channels) -> set[tuple[str, str]]:
+    return {(f"{source}{i}", f"{sink}{i}") for i in range(1, n + 1)}
+
+
+@pytest.fixture
+def running(setup):
+    """a running manager connecting src:out_ to sink:in_, with both clients present"""
+    setup.write_config([client_config("src:out_", n_channels, ["sink:in_"])])
+    add_client_ports(setup.server, "src:out_", n_channels, is_output=True)
+    add_client_ports(setup.server, "sink:in_", n_channels, is_output=False)
+    setup.manager()
+    setup.start()
+    setup.settle()
+    assert setup.server.connections == wanted("src:out_", "sink:in_")
+    return setup
+
+
+def test_initial_sync_connects_everything(running):
+    cm = running.cm
+    assert running.on_loop(cm.is_converged)
+    assert cm.converged_at is not None
+    assert cm.edges.counts[EdgeState.CONNECTED] == n_channels
+    assert running.server.calls["connect"] == n_channels
+
+
+def test_registrations_are_reconciled_in_few_passes(setup):
+    setup.write_config([client_config("src:out_", 64, ["sink:in_"])])
+    add_client_ports(setup.server, "sink:in_", 64, is_output=False)
+    cm = setup.manager()
+    setup.start()
+    setup.settle()
+    assert not setup.server.connections
+
+    add_client_ports(setup.server, "src:out_", 64, is_output=True)
+    setup.settle()
+    assert setup.server.connections == wanted("src:out_", "sink:in_", 64)
+    assert cm.reconcile_stats["events"] == 64
+    assert cm.reconcile_stats["passes"] < 64
+    metrics = setup.on_loop(cm.render_metrics)
+    assert "jack_connection_manager_port_events_total 64\n" in metrics
+    assert "jack_connection_manager_reconcile_passes_total " in metrics
+
+
+def test_sink_of_a_fan_in_pattern_is_connected_to_the_existing_sources(setup):
+    setup.write_config(
+        [
+            {
+                "pattern": "twonder*:out_{ch}",
+                "connections": [{"pattern": "system:playback_{ch}"}],
+            }
+        ]
+    )
+    add_client_ports(setup.server, "twonder1:out_", 2, is_output=True)
+    add_client_ports(setup.server, "twonder2:out_", 2, is_output=True)
+    setup.manager()
+    setup.start()
+    setup.settle()
+    assert not setup.server.connections
+
+    add_client_ports(setup.server, "system:playback_", 2, is_output=False)
+    setup.settle()
+    assert setup.server.connections == wanted(
+        "twonder1:out_", "system:playback_", 2
+    ) | wanted("twonder2:out_", "system:playback_", 2)
+
+
+def test_unregistered_ports_drop_their_edges(running):
+    cm, server = running.cm, running.server
+    for i in range(1, n_channels + 1):
+        server.remove_port(f"src:out_{i}")
+    running.settle()
+    assert len(cm.edges) == 0
+    assert not cm.edges.by_port
+    assert running.on_loop(cm.is_converged)
+
+    # registering the ports again rebuilds the edges from the rules
+    add_client_ports(server, "src:out_", n_channels, is_output=True)
+    running.settle()
+    assert server.connections == wanted("src:out_", "sink:in_")
+    assert cm.edges.counts[EdgeState.CONNECTED] == n_channels
+
+
+def test_unavailable_port_is_found_by_the_graph_check(running):
+    cm, server = running.cm, running.server
+    server.remove_port("src:out_1", available=False)
+    running.settle()
+    # the graph check runs right away instead of at its interval
+    for _ in range(100):
+        if len(cm.edges) < n_channels:
+            break
+        sleep(0.01)
+    assert len(cm.edges) == n_channels - 1
+    assert "src:out_1" not in running.on_loop(lambda: cm.graph.ports)
+
+
+def test_reload_only_applies_changed_rules(running):
+    cm, server = running.cm, running.server
+    add_client_ports(server, "other:in_", n_channels, is_output=False)
+    running.settle()
+    server.calls.clear()
+
+    running.write_config(
+        [client_config("src:out_", n_channels, ["sink:in_", "other:in_"])]
+    )
+    running.on_loop(cm.reload)
+    running.settle()
+    assert server.connections == wanted("src:out_", "sink:in_") | wanted(
+        "src:out_", "other:in_"
+    )
+    # the connections to sink:in_ were left untouched
+    assert server.calls["connect"] == n_channels
+    assert server.calls["disconnect"] == 0
+
+
+def test_server_restart_resyncs(running, monkeypatch):
+    monkeypatch.setattr(connection_manager, "reconnect_wait_time", 0.01)
+    cm, server = running.cm, running.server
+    server.shutdown()
+    server.start()
+    add_client_ports(server, "src:out_", n_channels, is_output=True)
+    add_client_ports(server, "sink:in_", n_channels, is_output=False)
+    for _ in range(500):
+        if cm.reconnect_stats["reconverge_time"] is not None:
+            break
+        sleep(0.01)
+    assert server.connections == wanted("src:out_", "sink:in_")
+    assert cm.reconnect_stats["reconnects"] == 1
+    assert cm.reconnect_stats["reconverge_time"] > 0
+    metrics = running.on_loop(cm.render_metrics)
+    assert "jack_connection_manager_reconnects_total 1\n" in metrics
+    assert "jack_connection_manager_reconverge_seconds " in metrics
+
+
+@pytest.fixture
+def strict(setup):
+    setup.write_config([client_config("src:out_", n_channels, ["sink:in_"])])
+    add_client_ports(setup.server, "src:out_", n_channels, is_output=True)
+    add_client_ports(setup.server, "sink:in_", n_channels, is_output=False)
+    setup.manager(strict=True)
+    setup.start()
+    setup.settle()
+    return setup
+
+
+def test_strict_removes_unexpected_and_restores_removed(strict):
+    cm, server = strict.cm, strict.server
+    server.connect("src:out_1", "sink:in_2")
+    server.disconnect("src:out_3", "sink:in_3")
+    strict.settle()
+    assert server.connections == wanted("src:out_", "sink:in_")
+    assert cm.strict_stats == {"removed": 1, "restored": 1}
+
+
+def test_strict_does_not_restore_a_closing_client(strict):
+    cm, server = strict.cm, strict.server
+    server.calls.clear()
+    server.remove_client("src")
+    strict.settle()
+    assert not server.connections
+    assert cm.strict_stats["restored"] == 0
+    assert server.calls["connect"] == 0
+    assert len(cm.edges) == 0
@@ -0,0 +1,92 @@
+from time import perf_counter
+
+import pytest
+
+from conftest import add_client_ports, client_config
+from jack_connection_manager.fake_jack import Port
+
+n_channels = 64
+
+
+class CountingRules:
+    """a rule index that counts the lookups made through it"""
+
+    def __init__(self, rules) -> None:
+        self.rules = rules
+        self.lookups = 0
+
+    def __getattr__(self, name):
+        self.lookups += 1
+        return getattr(self.rules, name)
+
+    def __contains__(self, port_name) -> bool:
+        self.lookups += 1
+        return port_name in self.rules
+
+
+def fan_out_manager(setup, n_sinks: int):
+    """a manager with n_sinks sink clients that every source port is connected to,
+    and the source ports that were not registered yet"""
+    sinks = [f"sink{i}:in_" for i in range(n_sinks)]
+    setup.write_config([client_config("source:out_", n_channels, sinks)])
+    for sink in sinks:
+        add_client_ports(setup.server, sink, n_channels, is_output=False)
+    # reconcile passes are due right away, so the test can run them itself
+    cm = setup.manager(coalesce_window=0, coalesce_max_latency=0)
+    cm.rules = CountingRules(cm.rules)
+    setup.server.calls.clear()
+    ports = [Port(f"source:out_{i}", True) for i in range(1, n_channels + 1)]
+    return cm, ports
+
+
+def callback_time(cm, ports) -> float:
+    """best time per port of registering ports in the callback"""
+    best = float("inf")
+    for _ in range(20):
+        cm.incoming.clear()
+        t_start = perf_counter()
+        for port in ports:
+            cm.port_registration_callback(port, True)
+        best = min(best, (perf_counter() - t_start) / len(ports))
+    return best
+
+
+@pytest.mark.parametrize("n_sinks", [1, 128])
+def test_callback_defers_matching_to_the_loop(setup, n_sinks):
+    cm, ports = fan_out_manager(setup, n_sinks)
+
+    for port in ports:
+        cm.port_registration_callback(port, True)
+
+    # one hand over per port, no rule lookups and no jack calls on the jack thread
+    assert len(cm.incoming) == len(ports)
+    assert cm.rules.lookups == 0
+    assert sum(setup.server.calls.values()) == 0
+    assert cm.queue.empty()
+
+    # the rules are matched by a single reconcile pass on the loop
+    cm.run_handed_over()
+    assert cm.reconcile_timer is not None
+    cm.reconcile()
+    assert cm.rules.lookups > 0
+    assert cm.reconcile_stats["passes"] == 1
+    assert cm.queue.qsize() == n_channels * n_sinks
+    assert sum(setup.server.calls.values()) == 0
+
+
+def test_callback_time_is_independent_of_fan_out(setup, tmp_path_factory):
+    cm, ports = fan_out_manager(setup, 1)
+    narrow = callback_time(cm, ports)
+    setup.stop()
+
+    wide_setup = type(setup)(tmp_path_factory.mktemp("wide"))
+    try:
+        cm, ports = fan_out_manager(wide_setup, 128)
+        wide = callback_time(cm, ports)
+        assert cm.rules.lookups == 0
+    finally:
+        wide_setup.stop()
+
+    # 128 times the connections per port, the generous bound only catches work
+    # that grows with the fan-out, not timing noise
+    assert wide < narrow * 4 + 2e-6
@@ -0,0 +1,51 @@
+import pytest
+
+from jack_connection_manager.rules import RuleIndex, parse_config
+
+
+def index(*rules) -> RuleIndex:
+    return RuleIndex(
+        parse_config(
+            [
+                {"pattern": source, "connections": [{"pattern": sink}]}
+                for source, sink in rules
+            ]
+        )
+    )
+
+
+def test_sink_pattern_can_leave_out_placeholders():
+    rules = index(("twonder*:out_{ch}", "system:playback_{ch}"))
+    ports = ["twonder1:out_1", "twonder2:out_1", "twonder2:out_2", "other:out_1"]
+    assert rules.peers("twonder2:out_1") == {"system:playback_1"}
+    assert rules.peers("system:playback_1", ports) == {
+        "twonder1:out_1",
+        "twonder2:out_1",
+    }
+    assert "system:playback_3" in rules
+    assert "system:capture_1" not in rules
+    assert list(rules.edges(ports)) == [
+        ("twonder1:out_1", "system:playback_1"),
+        ("twonder2:out_1", "system:playback_1"),
+        ("twonder2:out_2", "system:playback_2"),
+    ]
+
+
+def test_sink_pattern_with_other_placeholders_is_rejected():
+    with pytest.raises(ValueError, match="must all be used"):
+        index(("render:out_{ch}", "wfs:in_{i}_{ch}"))
+
+
+def test_patterns_sharing_their_prefix_or_without_one_are_indexed():
+    rules = index(
+        *((f"render{i}:out_{{ch}}", f"wfs:ch{{ch}}_render{i}") for i in range(100)),
+        *(
+            (f"{{host}}:render{i}_{{ch}}", f"{{host}}:wfs_in_{i}_{{ch}}")
+            for i in range(100)
+        ),
+    )
+    assert len(list(rules.patterns.candidates("wfs:ch3_render42"))) == 1
+    assert rules.peers("wfs:ch3_render42") == {"render42:out_3"}
+    assert len(list(rules.patterns.candidates("studio:render7_2"))) == 1
+    assert rules.peers("studio:render7_2") == {"studio:wfs_in_7_2"}
+    assert rules.peers("studio:wfs_in_7_2") == {"studio:render7_2"}
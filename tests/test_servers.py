@@ -0,0 +1,64 @@
+import threading
+from time import sleep
+
+import pytest
+import yaml
+
+from conftest import add_client_ports, client_config
+from jack_connection_manager.fake_jack import FakeJack
+from jack_connection_manager.servers import ServerGroup
+
+
+@pytest.fixture
+def group(tmp_path):
+    config_path = tmp_path / "connections.yml"
+    config_path.write_text(yaml.dump([client_config("src:out_", 8, ["sink:in_"])]))
+    backend = FakeJack()
+    for name in ("studio", "stage"):
+        server = backend.server(name)
+        add_client_ports(server, "src:out_", 8, is_output=True)
+        add_client_ports(server, "sink:in_", 8, is_output=False)
+        server.flush()
+    group = ServerGroup(
+        {"studio": config_path, "stage": config_path},
+        backend=backend,
+        watch_config=False,
+    )
+    thread = threading.Thread(target=group.connection_loop)
+    thread.start()
+    yield group
+    group.call_threadsafe(group.deactivate)
+    thread.join(5)
+
+
+def on_loop(group, function):
+    done = threading.Event()
+    result = []
+
+    def run():
+        result.append(function())
+        done.set()
+
+    group.loop.call_soon_threadsafe(run)
+    assert done.wait(5)
+    return result[0]
+
+
+def test_group_reports_the_state_of_every_server(group):
+    for _ in range(500):
+        if on_loop(group, group.is_converged):
+            break
+        sleep(0.01)
+    assert on_loop(group, group.is_converged)
+    assert on_loop(group, group.progress) == (
+        "studio: 8/8 edges, 0 pending; stage: 8/8 edges, 0 pending"
+    )
+
+    metrics = on_loop(group, group.render_metrics)
+    for servername in ("studio", "stage"):
+        assert (
+            f'jack_connection_manager_established_edges{{server="{servername}"}} 8'
+            in metrics
+        )
+    # every metric has a single HELP line for both servers
+    assert metrics.count("# HELP jack_connection_manager_established_edges ") == 1
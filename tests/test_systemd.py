@@ -0,0 +1,70 @@
+from time import sleep
+
+from conftest import add_client_ports, client_config
+from jack_connection_manager import systemd
+from jack_connection_manager.systemd import ServiceNotifier
+
+
+def notifier(setup, monkeypatch, watchdog_usec=None, ready_timeout=5.0):
+    if watchdog_usec is None:
+        monkeypatch.delenv("WATCHDOG_USEC", raising=False)
+    else:
+        monkeypatch.setenv("WATCHDOG_USEC", str(watchdog_usec))
+        monkeypatch.delenv("WATCHDOG_PID", raising=False)
+    setup.write_config([client_config("src:out_", 4, ["sink:in_"])])
+    add_client_ports(setup.server, "src:out_", 4, is_output=True)
+    add_client_ports(setup.server, "sink:in_", 4, is_output=False)
+    cm = setup.manager()
+    messages = []
+    service = ServiceNotifier(cm, messages.append, ready_timeout)
+    cm.services.append(service)
+    return service, messages
+
+
+def test_ready_after_the_initial_sync_without_polling(setup, monkeypatch):
+    service, messages = notifier(setup, monkeypatch)
+    setup.start()
+    setup.settle()
+    assert setup.on_loop(lambda: service.ready)
+    assert messages[-2:] == ["READY=1", "STATUS=4/4 edges, 0 pending"]
+    assert service.watchdog_timer is None
+    assert service.ready_timer.cancelled()
+
+    # nothing is sent while nothing changes
+    n_messages = len(messages)
+    sleep(0.1)
+    assert len(messages) == n_messages
+
+
+def test_progress_is_reported_on_changes(setup, monkeypatch):
+    monkeypatch.setattr(systemd, "status_interval", 0.01)
+    service, messages = notifier(setup, monkeypatch)
+    setup.start()
+    setup.settle()
+    setup.server.remove_client("sink")
+    setup.settle()
+    sleep(0.05)
+    assert messages[-1] == "STATUS=0/0 edges, 0 pending"
+
+    add_client_ports(setup.server, "sink:in_", 4, is_output=False)
+    setup.settle()
+    sleep(0.05)
+    assert messages[-1] == "STATUS=4/4 edges, 0 pending"
+    assert setup.on_loop(lambda: service.status_timer) is None
+
+
+def test_ready_timeout(setup, monkeypatch):
+    service, messages = notifier(setup, monkeypatch, ready_timeout=0.05)
+    # the connections are never made without a running worker
+    setup.cm.loop.call_later(0.2, setup.cm.loop.stop)
+    setup.cm.loop.run_forever()
+    assert "READY=1" in messages
+    assert not setup.cm.is_converged()
+
+
+def test_watchdog_pings(setup, monkeypatch):
+    service, messages = notifier(setup, monkeypatch, watchdog_usec=100_000)
+    setup.start()
+    setup.settle()
+    sleep(0.2)
+    assert messages.count("WATCHDOG=1") >= 2